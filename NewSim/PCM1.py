@@ -1,12 +1,15 @@
-import random
-import matplotlib.pyplot as plt
 import numpy as np
-import scipy as sc
-import math
 
-# Ideal Gas Properties Table
-gas_prop_table_csv = open('ideal_gas_prop.csv')
-gas_prop_table_array = np.loadtxt(gas_prop_table_csv, delimiter = ' ')
+try:
+    from .prop_backends import property_backend
+    from .stage_graph import shared_engine
+except ImportError:
+    from prop_backends import property_backend
+    from stage_graph import shared_engine
+
+# Ideal gas properties come from the active property backend
+# (prop_backends), the shared tables unless another one is selected, the
+# same backend calc() and monte_carlo() run on
 
 t = 0 #temperature is the first column, enthalpy is second, pr is third
 h = 1
@@ -14,158 +17,92 @@ p = 2
 
 def table_interp(val1, col_from, col_to):
 
-    table_from = gas_prop_table_array[:, col_from]
-    table_to = gas_prop_table_array[:, col_to]
-    
-    index = np.argmax(table_from >= val1)
-    ratio = (val1 - table_from[index - 1]) / (table_from[index] - table_from[index - 1])
-    val2 = ratio * (table_to[index] - table_to[index - 1]) + table_to[index - 1]
+    # Segment slopes and intercepts are precomputed when the table is loaded
+    val2 = property_backend().gas.lookup(val1, col_from, col_to)
 
     return val2
 
+# All table properties (T, h, pr, u, vr, s0) at one state from a single
+# table search, fields are read as state['T'], state['h'], state['pr']
+# Fitted backends return the T, h and pr fields only
+def table_state(val1, col_from):
+    return property_backend().gas.state(val1, col_from)
+
+# Isentropic process from T or h by a pressure ratio, through the table pr
+# column, returns exit T, h and pr
+def isentropic(val1, pressure_ratio, col_from):
+    return property_backend().gas.isentropic(val1, pressure_ratio, col_from)
+
 # Pressure: kPa (relative pressure: no units)
 # Temperature: K
 # Power: kW
 # Calorific Value: kJ/kg
 
+# Thrust (N) at 80 ml/min fuel flow and 300 K ambient
+# The S0 - S9 chain (isentropes through the table pr column, turbine
+# supplying the ideal compressor work, nozzle expanding by the turbine
+# pressure ratio) is stage_graph.pcm1_engine, its parameters are the
+# inputs: jetcat data, GTBA average efficiencies, kerosene fuel.
 def calc():
+    return shared_engine('PCM1').run('thrust')
 
-    # Input variables
-    maxFuelFlow = 80               #ml/min, jetcat data
-    v_in = 0                        #km/hr, static test condition
-    v_out = 1560                    #km/hr, jetcat data
-    pressureRatio_compressor = 2.9  #unitless, jetcat data
-    pressureRatio_combustor = 0.97  #unitless, okstate data
-    #pressureRatio_turbine =        #unitless, okstate data
-    eff_compressor = 0.675          #unitless, GTBA Average
-    eff_turbine = 0.725             #unitless, GTBA Average
-    eff_combustion = 0.925          #unitless, GTBA Average
-    m_air = 0.23                    #kg/s, jetcat data
-    EGT_lower = 753                 #K, jetcat data
-    EGT_upper = 993                 #K, jetcat data
-    works = False
-
-    # Atmospheric condition inputs
-    t_atm = 300                     #k, atmospheric temperature
-    p_atm = 101.3                   #kPa, atmospheric pressure
-    d_atm = 1.225                   #kg/m^3, atmospheric density
-
-    # Fuel inputs
-    d_kerosene = 0.821              #kg/m^3, internet
-    LHV_kerosene = 43.0             #MJ/kg, internet
-    m_fuel = d_kerosene * (maxFuelFlow / 1000 / 60)   #kg/s, fuel mass flow rate
-    m_tot = m_air + m_fuel          # total mass flow
-
-    # Combusion Efficiency
-    
-
-    # Atmosphere, S0
-    # temp and pressure at s1 (station 1), ideal gas assumption
-    t_0 = t_atm
-    p_0 = p_atm
-    h_0 = table_interp(t_0, t, h)
-
-    # Diffuser, S1
-    # Assume no engine diffuser
-
-    # Compressor Inlet, S2
-    # Conditions t,p,h are the same here as S0
-
-    # Post compressor, S3
-    # Isentropic Assumption
-    p_3 = pressureRatio_compressor * p_0
-    pr_3 = (p_3 / p_0) * table_interp(t_0, t, p)
-    t_3i = table_interp(pr_3, p, t)
-    h_3i = table_interp(t_3i, t, h)
-    w_ci = m_air * (h_3i - h_0)
-    wca = w_ci / eff_compressor
-    h3a = wca / m_air + h_0
-
-    # Post combustor, S4
-    # Energy provided by fuel (kJ) 
-    q_fuel_ideal = m_fuel * LHV_kerosene * 1000 # kJ
-    q_fuel_actual = eff_combustion * q_fuel_ideal #kJ
-    p_4 = p_3 * pressureRatio_combustor
-    # ideal
-    h_4i = (q_fuel_actual / m_tot) + h_3i
-    t_4i = table_interp(h_4i, h, t)
-    pr_4i = (p_4 / p_3) * table_interp(t_4i, t, p)
-    # actual
-    h_4a = (q_fuel_actual / m_tot) + h3a
-    t_4a = table_interp(h_4a, h, t)
-    pr_4a = table_interp(t_4a, t, p)
-    #pr_4a = (p_4 / p_3) * table_interp(t_4a, t, p)
-    # Post turbine, S5 
-    # condition w_c = w_t
-    h5a = h_4a - (w_ci / (m_tot * eff_turbine))
-    pr5a = table_interp(h5a,h,p)
-    pressureRatio_turbine = pr5a / pr_4a
-    p5 = pressureRatio_turbine * p_4
-
-    wta = m_tot * (h_4a - h5a)
-    # Afterburner, S6 - S8
-    # Not used
-
-    # Nozzle exit plane, S9
-    # Currently not calculating ideal case for simplicity
-    # Perfect expansion assumption
-    p_9 = p_0
-    pr9a = pressureRatio_turbine * pr5a
-    h_9a = table_interp(pr9a,p,h)
-    v_9 = math.sqrt(2000 * (h5a - h_9a))
-    t_9a = table_interp(pr9a,p,t)
-
-    # Thrust
-    density = p_9 / (0.2871 * t_9a)
-    thrust = m_tot * (v_9 - (v_in * 1000 / 3600)) #in m/s, N
-    # print("Actual Thrust:", f_actual)
-    # print("Comp work:", w_ca)
-    # print("Turb work:", wta)
-    # print("EGT:", t_9a)
-    
-    # Output
-
-
-    # if (t_9a < EGT_lower or t_9a > EGT_upper) and w_ca > wta:
-    #     print("EGT out of bounds")
-    #     print("Work balance does not close")
-    # elif w_ca > wta:
-    #     print("Work balance does not close")
-    # elif t_9a < EGT_lower or t_9a > EGT_upper:
-    #     print("EGT out of bounds")
-    # else:
-    #     works = True 
-    #     print(works)        
-
-    return thrust
-
-print(calc())
 # Monte Carlo Simulations
 
-def monte_carlo(runs):
-    total_data = np.zeros(shape = (runs, len(calc()))) #initialize tracking data
-    data_row, data_col = total_data.shape
-
-    #runs
-    for i in range(runs): 
-        data = calc()
-        total_data[i] = data #assign run data to tracking data
-
-    #average and standard deviation
-    output_mean = np.zeros(shape = (data_col))
-    output_sd = np.zeros(shape = (data_col))
-    for i in range(data_col):
-        output_mean[i] = np.mean(total_data[:, i])
-        output_sd[i] = np.std(total_data[:, i])
-
-    return total_data, output_mean, output_sd
+# Uncertain inputs, normally distributed, name: (mean, standard deviation)
+# Means are the calc() values, names are stage_graph.PARAMS
+UNCERTAIN_INPUTS = {
+    'eff_comp': (0.675, 0.02),      #unitless, GTBA spread
+    'eff_comb': (0.925, 0.02),      #unitless
+    'eff_turb': (0.725, 0.02),      #unitless
+    'm_air': (0.23, 0.005),         #kg/s
+    'lhv_fuel': (43000, 500),       #kJ/kg
+    'd_fuel': (821, 5),             #kg/m^3
+    't0': (300, 5),                 #K
+    'p0': (101.3, 1.0),             #kPa
+}
+
+# Output columns, stage_graph state keys
+MC_OUTPUTS = ('thrust', 'v9', 't4', 't9', 'w_comp', 'w_turb')
+
+# Samples every uncertain input for all runs up front (efficiencies capped
+# at 1) and evaluates them in batches of `chunk` runs through the calc()
+# chain (stage_graph.pcm1_engine). Returns the (runs, outputs) data matrix,
+# the mean and standard deviation of every output column and the range
+# status bits of every run (prop_tables BELOW_RANGE ...), nonzero where a
+# property lookup left the tables and was extrapolated. Those runs are in
+# the statistics, np.count_nonzero(status) counts them.
+def monte_carlo(runs, seed=0, uncertain=UNCERTAIN_INPUTS, outputs=MC_OUTPUTS, chunk=1000000):
+    if runs < 1:
+        raise ValueError("runs must be at least 1")
+    rng = np.random.default_rng(seed)
+    samples = {name: rng.normal(mean, sd, runs) for name, (mean, sd) in uncertain.items()}
+    for name, val in samples.items():
+        if name.startswith('eff_'):
+            np.minimum(val, 1.0, out=val)
+
+    engine = shared_engine('PCM1')
+    total_data = np.empty((runs, len(outputs)))
+    status = np.empty(runs, dtype=np.uint8)
+    for start in range(0, runs, chunk):
+        batch = {name: val[start:start + chunk] for name, val in samples.items()}
+        # Samples the cycle cannot reach (e.g. nozzle below ambient) are nan
+        with np.errstate(invalid='ignore'):
+            data, status[start:start + chunk] = engine.run(tuple(outputs), status=True, **batch)
+        total_data[start:start + chunk] = np.column_stack(data)
+
+    # Statistics over the valid samples of each output
+    output_mean = np.nanmean(total_data, axis=0)
+    output_sd = np.nanstd(total_data, axis=0)
+
+    return total_data, output_mean, output_sd, status
 
 # Plot Single Outputs from Monte Carlo Simulations
 def single_output_data(mc, datapoint):
-    total_data, output_mean, output_sd = mc
+    total_data, output_mean, output_sd, status = mc
     data = total_data[:, datapoint]
     mean = output_mean[datapoint]
 
+    import matplotlib.pyplot as plt
     plt.hist(data, bins = 20)
     plt.axvline(mean, color='k', linestyle='dashed', linewidth=1)
 
@@ -175,8 +112,8 @@ def single_output_data(mc, datapoint):
 
 # Run Simulation
 
-#mc = monte_carlo(runs)
-#total_data, output_mean, output_sd = mc
+#mc = monte_carlo(1000000)
+#total_data, output_mean, output_sd, status = mc
 
 #Get Data
 
@@ -188,6 +125,14 @@ def single_output_data(mc, datapoint):
 
 
 
+def main():
+    print(calc())
+
+
+if __name__ == '__main__':
+    main()
+
+
 '''
  isentropic efficiency of compressor and turbine
  Model the pressure drop through the engine appropriately
@@ -1,13 +1,23 @@
 
-import matplotlib.pyplot as plt
+import functools
+
 import numpy as np
-import scipy as sc
-import math
-import random
 
-# Load ideal gas properties table
-gasPropCsv = open('ideal_gas_prop.csv')
-gasPropArray = np.loadtxt(gasPropCsv, delimiter = ' ')
+try:
+    from .lookup_stats import set_station
+    from .prop_backends import property_backend, TABULATED
+    from .prop_tables import gas_table, shc_table, table_dtype, ambient_cache, T, H, CP, CV
+    from .stage_graph import shared_engine
+    from .station_record import StationRecord
+except ImportError:
+    from lookup_stats import set_station
+    from prop_backends import property_backend, TABULATED
+    from prop_tables import gas_table, shc_table, table_dtype, ambient_cache, T, H, CP, CV
+    from stage_graph import shared_engine
+    from station_record import StationRecord
+
+# Ideal gas properties and specific heats come from the active property
+# backend (prop_backends), the shared tables unless another one is selected
 
 # Match table column to data type
 t = 0 # temperature
@@ -15,23 +25,18 @@ h = 1 # entropy
 pr = 2 # relative pressure
 
 # Table interpolation function
-# Input value, input type and output type
+# Input value (scalar or array of any shape), input type and output type
+# float32 arrays are looked up in float32 tables
 def interp(val, typeIn, typeOut): 
     
-    # Extract input and output type arrays from table
-    tableIn = gasPropArray[:, typeIn]
-    tableOut = gasPropArray[:, typeOut]
-
-    # Get index of first value in input type array greater than input value
-    i = np.argmax(tableIn >= val) 
-
-    # Map input value onto output type array
-    ratio = (val - tableIn[i - 1]) / (tableIn[i] - tableIn[i - 1])
-    val_out = ratio * (tableOut[i] - tableOut[i - 1]) + tableOut[i - 1] 
-    return val_out
+    # Segment slopes and intercepts are precomputed when the table is loaded
+    return property_backend(dtype=table_dtype(val)).gas.lookup(val, typeIn, typeOut)
 
-specHeatCsv = open('shc_air.csv')
-specHeatArray = np.loadtxt(specHeatCsv, delimiter = ' ')
+# Cp, cv and gamma interpolation function
+# Input temperature value (scalar or array), returns cp, cv and gamma
+# from a single table index search
+def specHeat(temp):
+    return property_backend(dtype=table_dtype(temp)).shc.spec_heat(temp)
 
 # Cp and Gamma interpolation function
 # Input temperature value, output type (cp: 1, gamma: 2)
@@ -41,156 +46,143 @@ def k_interp(temp, type):
     cpType = 1
     gammaType = 2
 
-    # Extract input and output type arrays from table
-    tableTemp = specHeatArray[:, 0]
-    tableCp = specHeatArray[:, 1]
-    tableCv = specHeatArray[:, 2]
-
-    # Get index of first value in input type array greater than input value
-    i = np.argmax(tableTemp >= temp)
-
-    # Map input value onto output type array
-    ratio = (temp - tableTemp[i-1]) / (tableTemp[i] - tableTemp[i - 1])
-
-    cp = ratio * (tableCp[i] - tableCp[i - 1]) + tableCp[i - 1] 
-    cv = ratio * (tableCv[i] - tableCv[i - 1]) + tableCv[i - 1] 
+    cp, cv, gamma = specHeat(temp)
 
     # Return selected output value
     if type == cpType:
         return cp
     elif type == gammaType:
-        return cp / cv
+        return gamma
 
 
+# Thrust (N) from fuel flow (ml/min), electrical load (kW) and generator
+# efficiency, scalars or arrays broadcast against each other (NumPy path),
+# see fuelLevelBatch for the batch entry point
 def fuelLevel(flowFuel, wElec, effGen):
-
-    # Turbine pressure ratio is calculated (w_turbine = w_compressor)
-    # Input variables
-    # Component Efficiencies                Unit        Source / notes
-    effComp = 0.675                         # none      GTBA
-    effComb = 0.925                         # none      GTBA
-    effTurb = 0.725                         # none      GTBA
-    effNozz = 1                             # none      
-    flowFuel = flowFuel/ 10**6 / 60         # m^3/s     Jetcat
-    mAir = 0.23                             # kg/s      Jetcat 
-    # Atmospheric Conditions
-    t0 = 293.15                             # K         Test conditions
-    p0 = 101.3                              # kPa       Test conditions
-    # Fuel inputs
-    dFuel = 821                             # kg/m^3    Kerosene
-    lhvFuel = 43.0 * 1000                   # kJ/kg     Kerosene
-    mFuel = dFuel * flowFuel                # kg/s      calc
-    f = mFuel / mAir                        # none      calc
-    mTot = mFuel + mAir                     # kg/s      calc
-    # Known pressure ratios
-    pressComp = 2.9                         # none      Jetcat
-    pressComb = 0.97                        # none      OK State
-    # Heat Capacities
-    gammaLow = k_interp(t0, 2)              # unitless
-    cpLow = k_interp(t0, 1)                 # kJ/kgK
-
-    # S00, Generator
-    wShaft = wElec / effGen                 # Shaft power 
-
-    # S0, Atmosphere
-    h0 = interp(t0, t, h)
-
-    # S1, Diffuser
-    # Same as S0
-
-    # S2, Compressor inlet
-    # Same as S0
-
-    # S3, Post compressor
-    p3 = pressComp * p0
-
-    t3i = t0 * (pressComp ** ((gammaLow - 1) / gammaLow))
-    h3i = interp(t3i, t, h)
-    
-    wCompi = mAir * (h3i - h0)
-    wCompa = wCompi / effComp + wShaft
-    
-    h3a = (wCompa / mAir) + h0
-    t3a = interp(h3a, h, t)
-
-    # S4, Post combustor
-    qFueli = mFuel * lhvFuel
-    qFuela = qFueli * effComb
-
-    h4a = (qFuela / mTot) + (h3a / (1 + f))
-    t4a = interp(h4a, h, t)
-    p4 = pressComb * p3
-
-    gammaHigh = k_interp(t4a, 2)
-
-    # S5, Post turbine
-    h5a = h4a - (wCompa / (mTot * effTurb))
-    t5a = interp(h5a, h, t)
-
-    pTurb = ((t5a / t4a) ** (gammaHigh / (gammaHigh - 1)))
-
-    p5 = pTurb * p4
-
-    # S6 - S7, Afterburner
-    # Not used
-
-    # S8, Nozzle exit plane
-    p8 = p5
-    t8a = t5a
-    h8a = h5a
-
-    # S9, Exit
-    h9a = h0
-
-    cp_mid = k_interp(t8a, 1)
-    gamma_mid = k_interp(t8a, 2)
-
-    v9 = math.sqrt(2000 * cp_mid * t8a * (1 - ((p0 / p8) ** ((gamma_mid - 1) / gamma_mid))))
-    thrust = mTot * v9
-
-    # Temperature and Pressure Plotting
-    '''
-    stations = np.arange(0, 6, 1)
-    temperatures = np.array([t0, t0, t3a, t4a, t5a, t8a])
-    pressures = np.array([p0, p0, p3, p4, p5, p8])
-
-    figTemp, ax = plt.subplots(figsize=(12,6))
-    plt.plot(stations, temperatures)
-    plt.xlabel("Station", size=12)
-    plt.ylabel("Temperature (K)", size=12)
-    plt.title("Jet Engine Model Temperatures", size=15)
-    for index in range(len(stations)):
-      ax.text(stations[index] - 0.2, temperatures[index] + 20, int(temperatures[index]), size=12)
-    plt.xticks(stations, size=12)
-    plt.grid()
-    plt.show()
-
-    figPress, ax = plt.subplots(figsize=(12,8))
-    plt.plot(stations, pressures)
-    plt.xlabel("Station", size=12)
-    plt.ylabel("Pressure (kPa)", size=12)
-    plt.title("Jet Engine Model Pressures", size=15)
-    for index in range(len(stations)):
-      ax.text(stations[index] - 0.2, pressures[index] + 4, int(pressures[index]), size=12)
-    plt.xticks(stations, size=12)
-    plt.grid()
-    plt.show()
-    '''
-
-    return thrust
-
-print(fuelLevel(339.98, 0, 1))
+    return fuelLevelChain(flowFuel, wElec, effGen)[0]
+
+
+# S0 - S9 station chain, returns thrust (N), t4a and t8a (K)
+# The chain (table enthalpies, cp and gamma at one temperature, the
+# turbine supplying compressor and generator work) is stage_graph.pcm4_engine,
+# its parameters are the cycle inputs: GTBA efficiencies, jetcat data,
+# test conditions, kerosene fuel.
+# float32 input arrays are evaluated with float32 tables and stay float32
+# products: optional product_tables.ProductTable (T x f with h, cp, cv),
+# used for the gas from the combustor exit on instead of the air tables
+# record: optional station_record.StationRecord of the batch shape, filled
+# with every station state
+def fuelLevelChain(flowFuel, wElec, effGen, products=None, record=None):
+    engine = shared_engine('PCM4')
+    inputs = dict(flow_fuel=flowFuel, w_elec=wElec, eff_gen=effGen)
+    if record is None:
+        return engine.run(('thrust', 't4', 't8'), products=products, **inputs)
+    engine.run(record=record, products=products, **inputs)
+    return record['thrust'], record['t4'], record['t8']
+
+
+# Compiled kernels (jit_kernels), loaded on the first batched call since
+# importing numba takes longer than everything else in the package
+@functools.lru_cache(maxsize=None)
+def kernels():
+    try:
+        from . import jit_kernels
+    except ImportError:
+        import jit_kernels
+    return jit_kernels
+
+
+# Batched fuelLevel, the inputs broadcast against each other NumPy-style,
+# e.g. fuelLevelBatch(fuel[:, None], wElec[None, :], 1.0) is a fuel x wElec
+# grid in one pass. Outputs have the broadcast shape.
+# backend 'numba' runs the compiled S0 - S9 kernel (parallel over samples),
+# 'numpy' runs fuelLevelChain on the arrays, 'auto' picks numba when installed
+# (the kernel uses the tables, other property backends run on numpy)
+# dtype float32 halves memory traffic: float32 inputs, tables and outputs
+# (see fuelLevelAccuracy for the error against float64)
+# stations=True returns a StationRecord (T, p, h at every station, work,
+# velocity and thrust) instead of thrust only
+# products: product gas table for fuelLevelChain (NumPy path only)
+def fuelLevelBatch(flowFuel, wElec, effGen, backend='auto', parallel=True,
+                   dtype=np.float64, stations=False, products=None):
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError("dtype must be float32 or float64")
+    inputs = [np.asarray(a, dtype=dtype) for a in (flowFuel, wElec, effGen)]
+    flowFuel, wElec, effGen = np.broadcast_arrays(*inputs)
+
+    if backend == 'auto':
+        tabulated = property_backend().name == TABULATED
+        backend = 'numba' if products is None and tabulated and kernels().HAVE_NUMBA else 'numpy'
+    record = StationRecord(flowFuel.shape, dtype) if stations else None
+    if backend == 'numpy':
+        thrust = fuelLevelChain(flowFuel, wElec, effGen, products, record)[0]
+        return record if stations else thrust
+    if backend != 'numba':
+        raise ValueError("backend must be 'auto', 'numba' or 'numpy'")
+    if not kernels().HAVE_NUMBA:
+        raise ImportError("backend 'numba' needs numba installed")
+    if products is not None:
+        raise ValueError("product gas tables need backend='numpy'")
+    if property_backend().name != TABULATED:
+        raise ValueError("property backend %r needs backend='numpy'" % property_backend().name)
+
+    gas = gas_table(dtype)
+    shc = shc_table(dtype)
+    params = shared_engine('PCM4').engine.params
+    # The kernel's own lookups are compiled and not recorded, only the
+    # ambient ones are
+    set_station('S0')
+    ambient = ambient_cache.get(params['t0'], params['p0'], gas, shc)
+    set_station(None)
+    kernel = kernels().fuel_level_parallel if parallel else kernels().fuel_level_serial
+
+    # The kernel skips the station rows when the record is empty
+    rows = record.rows() if stations else np.empty((0, 0), dtype=dtype)
+    thrust = record['thrust'] if stations else np.empty(flowFuel.shape, dtype=dtype)
+    # Broadcast views are not writeable arrays, the kernel gets real copies
+    # of the inputs that were broadcast
+    shape = flowFuel.shape
+    flat = [(a if a.shape == shape else np.broadcast_to(a, shape).copy()).ravel() for a in inputs]
+    kernel(*flat,
+           *(params[name] for name in ('eff_comp', 'eff_comb', 'eff_turb', 'm_air', 't0', 'p0',
+                                       'd_fuel', 'lhv_fuel', 'press_comp', 'press_comb')),
+           ambient.h0, ambient.cp, ambient.gamma,
+           *gas.linear_segments(T, H), *gas.linear_segments(H, T),
+           *shc.linear_segments(T, CP), *shc.linear_segments(T, CV)[1:],
+           thrust.reshape(-1), rows)
+    return record if stations else thrust
+
+
+# Accuracy of a reduced precision batch against float64
+# Draws n random operating points in dtype (fuel flow 200 - 390 ml/min,
+# wElec 0 - 1 kW, effGen 0.5 - 1), evaluates them in dtype and the first
+# `reference` of them again in float64. Returns the max and RMS absolute
+# deviation of thrust (N), t4a and t8a (K) as {name: (max, rms)}.
+def fuelLevelAccuracy(n=1000000, dtype=np.float32, reference=10000, seed=0, backend='auto'):
+    rng = np.random.default_rng(seed)
+    flowFuel = 200 + 190 * rng.random(n, dtype=dtype)
+    wElec = rng.random(n, dtype=dtype)
+    effGen = 0.5 + 0.5 * rng.random(n, dtype=dtype)
+
+    low = fuelLevelBatch(flowFuel, wElec, effGen, backend, dtype=dtype, stations=True)
+    ref = fuelLevelBatch(flowFuel[:reference], wElec[:reference], effGen[:reference],
+                         backend, dtype=np.float64, stations=True)
+
+    report = {}
+    for name, field in (('thrust', 'thrust'), ('t4a', 't4'), ('t8a', 't8')):
+        err = low[field][:reference].astype(np.float64) - ref[field]
+        report[name] = (np.abs(err).max(), np.sqrt(np.mean(err ** 2)))
+    return report
 
 
 # Plot fuelLevel
 
 def plotFuelLevel(wElec, effGen):
     fuelRange = np.arange(200, 390, 1)
-    thrustValues = np.zeros(len(fuelRange))
-
-    for i in range(len(fuelRange)):
-        thrustValues[i] = fuelLevel(fuelRange[i], wElec, effGen)
+    thrustValues = fuelLevelBatch(fuelRange, wElec, effGen)
 
+    import matplotlib.pyplot as plt
     figTemp, ax = plt.subplots(figsize=(12,6))
     plt.plot(fuelRange, thrustValues, color = 'b')
     plt.axhline(y= 100, color = 'r')
@@ -207,4 +199,12 @@ def plotFuelLevel(wElec, effGen):
 
 
 # At wElec = 0.0, effGen = 1.0, fuelFlow = 339.98 for 100 N thrust output (100.000919)
-# At wElec = 0.5, effGen = 0.5, fuelFlow = 349.38 for 100 N thrust output (100.000352)
\ No newline at end of file
+# At wElec = 0.5, effGen = 0.5, fuelFlow = 349.38 for 100 N thrust output (100.000352)
+
+
+def main():
+    print(fuelLevel(339.98, 0, 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# PJP engine cycle models (PCM1 - PCM4) and their shared property tables
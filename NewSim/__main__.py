@@ -0,0 +1,23 @@
+import argparse
+import importlib
+
+# Run cycle models from the package, python -m NewSim [PCM1 ... PCM4]
+# Each model prints its result like running its module as a script
+
+MODELS = ('PCM1', 'PCM2', 'PCM3', 'PCM4')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m NewSim', description="Run PJP engine cycle models")
+    parser.add_argument('models', nargs='*', metavar='model',
+                        help="any of %s (default: all)" % ', '.join(MODELS))
+    args = parser.parse_args(argv)
+    for name in args.models:
+        if name not in MODELS:
+            parser.error("unknown model %r, choose from %s" % (name, ', '.join(MODELS)))
+    for name in args.models or MODELS:
+        importlib.import_module('NewSim.' + name).main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import functools
+
+import numpy as np
+
+try:
+    from .prop_tables import shc_table, T, CP, CV
+except ImportError:
+    from prop_tables import shc_table, T, CP, CV
+
+# Cumulative integrals of the specific heat table for variable cp stages
+# cp is piecewise linear in T between table rows, cp = a + b T, so both
+#   H(T) = int cp dT       (piecewise quadratic)
+#   S(T) = int cp / T dT   (a ln T + b T per segment)
+# are exact at every temperature from their values at the rows. Enthalpy
+# changes and isentropic temperature ratios then cost two lookups and a
+# subtraction instead of integrating cp per sample. Temperatures outside
+# the table continue the end segments, like the EXTRAPOLATE policy.
+
+NEWTON_STEPS = 3    # S(T) inversion, from a linear first guess
+
+
+class CpIntegrals:
+
+    # temps: increasing table temperatures (K), cp, cv: kJ/kgK at temps
+    # Integrals start at temps[0]. The gas constant is the mean of cp - cv.
+    def __init__(self, temps, cp, cv):
+        self.x = np.array(temps, dtype=float)
+        self.cp = np.array(cp, dtype=float)
+        self.gas_const = float(np.mean(np.asarray(cp) - np.asarray(cv)))
+
+        dx = np.diff(self.x)
+        self.b = np.diff(self.cp) / dx
+        self.a = self.cp[:-1] - self.b * self.x[:-1]
+        self.h = np.concatenate(([0.0], np.cumsum((self.cp[:-1] + self.cp[1:]) / 2 * dx)))
+        self.s = np.concatenate(([0.0], np.cumsum(self.a * np.log(self.x[1:] / self.x[:-1]) + self.b * dx)))
+
+    def segment(self, knots, val):
+        return np.clip(np.searchsorted(knots, val) - 1, 0, len(knots) - 2)
+
+    # int cp dT from temps[0] to temp, kJ/kg
+    def enthalpy(self, temp):
+        temp = np.asarray(temp, dtype=float)
+        i = self.segment(self.x, temp)
+        dt = temp - self.x[i]
+        return self.h[i] + dt * (self.cp[i] + 0.5 * self.b[i] * dt)
+
+    # int cp / T dT from temps[0] to temp, kJ/kgK
+    def entropy(self, temp):
+        temp = np.asarray(temp, dtype=float)
+        i = self.segment(self.x, temp)
+        return self.s[i] + self.a[i] * np.log(temp / self.x[i]) + self.b[i] * (temp - self.x[i])
+
+    # Temperature at enthalpy h, the root of the segment quadratic
+    def temperature(self, h):
+        h = np.asarray(h, dtype=float)
+        i = self.segment(self.h, h)
+        dh = h - self.h[i]
+        cp = self.cp[i]
+        return self.x[i] + 2 * dh / (cp + np.sqrt(cp * cp + 2 * self.b[i] * dh))
+
+    # Temperature at entropy s, Newton steps with dS/dT = cp / T
+    def entropy_temperature(self, s):
+        s = np.asarray(s, dtype=float)
+        i = self.segment(self.s, s)
+        temp = self.x[i] + (s - self.s[i]) * (self.x[i + 1] - self.x[i]) / (self.s[i + 1] - self.s[i])
+        for _ in range(NEWTON_STEPS):
+            err = self.s[i] + self.a[i] * np.log(temp / self.x[i]) + self.b[i] * (temp - self.x[i]) - s
+            temp = temp - err * temp / (self.a[i] + self.b[i] * temp)
+        return temp
+
+    # Enthalpy change from t_in to t_out, kJ/kg
+    def delta_h(self, t_in, t_out):
+        return self.enthalpy(t_out) - self.enthalpy(t_in)
+
+    # Temperature after adding dh (kJ/kg, negative for work extracted) at t_in
+    def heat(self, t_in, dh):
+        return self.temperature(self.enthalpy(t_in) + dh)
+
+    # Isentropic exit temperature for pressure_ratio = p_out / p_in
+    def isentropic(self, t_in, pressure_ratio):
+        return self.entropy_temperature(self.entropy(t_in) + self.gas_const * np.log(pressure_ratio))
+
+    # Pressure ratio p_out / p_in of an isentropic change from t_in to t_out
+    def pressure_ratio(self, t_in, t_out):
+        return np.exp((self.entropy(t_out) - self.entropy(t_in)) / self.gas_const)
+
+
+# Shared integrals of the specific heat table, built on first use
+@functools.lru_cache(maxsize=None)
+def cp_integrals():
+    shc = shc_table()
+    return CpIntegrals(shc.array[:, T], shc.array[:, CP], shc.array[:, CV])
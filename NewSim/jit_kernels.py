@@ -0,0 +1,174 @@
+import types
+
+import numpy as np
+
+# Numba is optional, callers check HAVE_NUMBA and use their NumPy path
+# when it is not installed
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+
+
+def jit(**options):
+    if numba is None:
+        return lambda func: func
+
+    def decorate(func):
+        # numba names cache files after the source file and qualname only, so
+        # package (NewSim.jit_kernels) and script (jit_kernels) imports would
+        # load each other's kernels. Package kernels get their own names.
+        if __package__ and not func.__qualname__.startswith(__package__ + '.'):
+            func.__qualname__ = '%s.%s' % (__package__, func.__qualname__)
+        return numba.njit(cache=True, **options)(func)
+    return decorate
+
+
+# Copy of func under its own qualname, for building several kernels (e.g.
+# parallel and serial) from one function. numba keys its cache files on the
+# qualname but not on the jit options, so variants sharing a name would
+# load whichever build was cached first.
+def variant(func, suffix):
+    copy = types.FunctionType(func.__code__, func.__globals__, func.__name__ + '_' + suffix,
+                              func.__defaults__, func.__closure__)
+    copy.__qualname__ = func.__qualname__ + '_' + suffix
+    return copy
+
+
+prange = numba.prange if HAVE_NUMBA else range
+
+
+# Segment index of a scalar value, same convention as PropertyTable.index:
+# values outside the table use the first or last table segment
+@jit(inline='always')
+def segment(x, val):
+    lo = 0
+    hi = len(x) - 1
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if x[mid] <= val:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+# Linear table lookup of a scalar value from precomputed segment
+# slopes and intercepts (PropertyTable.linear_segments)
+@jit(inline='always')
+def interp(x, slope, intercept, val):
+    i = segment(x, val)
+    return slope[i] * val + intercept[i]
+
+
+def _lookup(x, slope, intercept, val, out):
+    for k in prange(len(val)):
+        out[k] = interp(x, slope, intercept, val[k])
+
+
+lookup_parallel = jit(parallel=True)(variant(_lookup, 'parallel'))
+lookup_serial = jit()(variant(_lookup, 'serial'))
+
+
+# Compiled batch lookup on a PropertyTable, 1-D input values
+# Dense tables are looked up on their dense grids, like table.lookup
+def lookup(table, val, col_in, col_out, parallel=True):
+    val = np.ascontiguousarray(val, dtype=float)
+    if not HAVE_NUMBA:
+        return table.lookup(val, col_in, col_out)
+
+    out = np.empty(val.shape)
+    kernel = lookup_parallel if parallel else lookup_serial
+    kernel(*table.linear_segments(col_in, col_out), val.reshape(-1), out.reshape(-1))
+    return out
+
+
+# PCM4 fuelLevel S0 - S9 chain, one fused loop over samples
+# stage_graph.pcm4_engine lowered by hand (eff_nozz = 1), without per
+# station temporary arrays. tests/test_stage_graph.py checks both agree.
+# Ambient (station 0) properties are computed once by the caller.
+# Knots and segments come from PropertyTable.linear_segments, so dense
+# tables give the dense grid values (by binary search over the grid).
+# record is a (fields, samples) station block, rows in station_record.FIELDS
+# order, only written when it has one column per sample.
+def _fuel_level(flowFuel, wElec, effGen,
+                effComp, effComb, effTurb, mAir, t0, p0, dFuel, lhvFuel, pressComp, pressComb,
+                h0, cpLow, gammaLow,
+                tKnots, tToHSlope, tToHIntercept, hKnots, hToTSlope, hToTIntercept,
+                shcKnots, cpSlope, cpIntercept, cvSlope, cvIntercept,
+                thrust, record):
+
+    # Sample independent terms
+    p3 = pressComp * p0
+    p4 = pressComb * p3
+    t3i = t0 * (pressComp ** ((gammaLow - 1) / gammaLow))
+    h3i = interp(tKnots, tToHSlope, tToHIntercept, t3i)
+    wCompi = mAir * (h3i - h0)
+    stations = record.shape[1] == len(thrust)
+
+    for k in prange(len(thrust)):
+        mFuel = dFuel * flowFuel[k] / 10**6 / 60
+        f = mFuel / mAir
+        mTot = mFuel + mAir
+
+        # S3, Post compressor
+        wShaft = wElec[k] / effGen[k]
+        wCompa = wCompi / effComp + wShaft
+        h3a = (wCompa / mAir) + h0
+
+        # S4, Post combustor
+        qFuela = mFuel * lhvFuel * effComb
+        h4a = (qFuela / mTot) + (h3a / (1 + f))
+        t4a = interp(hKnots, hToTSlope, hToTIntercept, h4a)
+        i = segment(shcKnots, t4a)
+        gammaHigh = (cpSlope[i] * t4a + cpIntercept[i]) / (cvSlope[i] * t4a + cvIntercept[i])
+
+        # S5, Post turbine
+        h5a = h4a - (wCompa / (mTot * effTurb))
+        t5a = interp(hKnots, hToTSlope, hToTIntercept, h5a)
+        p5 = ((t5a / t4a) ** (gammaHigh / (gammaHigh - 1))) * p4
+
+        # S8, Nozzle exit plane, S9, Exit
+        t8a = t5a
+        i = segment(shcKnots, t8a)
+        cpMid = cpSlope[i] * t8a + cpIntercept[i]
+        gammaMid = cpMid / (cvSlope[i] * t8a + cvIntercept[i])
+
+        v9 = np.sqrt(2000 * cpMid * t8a * (1 - ((p0 / p5) ** ((gammaMid - 1) / gammaMid))))
+        thrust[k] = mTot * v9
+        if stations:
+            t3a = interp(hKnots, hToTSlope, hToTIntercept, h3a)
+            dh9 = v9 * v9 / 2000
+            record[0, k] = t0
+            record[1, k] = p0
+            record[2, k] = h0
+            record[3, k] = t0
+            record[4, k] = p0
+            record[5, k] = h0
+            record[6, k] = t3a
+            record[7, k] = p3
+            record[8, k] = h3a
+            record[9, k] = t4a
+            record[10, k] = p4
+            record[11, k] = h4a
+            record[12, k] = t5a
+            record[13, k] = p5
+            record[14, k] = h5a
+            record[15, k] = t8a
+            record[16, k] = p5
+            record[17, k] = h5a
+            record[18, k] = t8a - dh9 / cpMid
+            record[19, k] = p0
+            record[20, k] = h5a - dh9
+            record[21, k] = wShaft
+            record[22, k] = wCompi / effComp
+            record[23, k] = mTot * (h4a - h5a)
+            record[24, k] = qFuela
+            record[25, k] = v9
+            record[26, k] = thrust[k]
+
+
+fuel_level_parallel = jit(parallel=True)(variant(_fuel_level, 'parallel'))
+fuel_level_serial = jit()(variant(_fuel_level, 'serial'))
@@ -0,0 +1,149 @@
+import contextlib
+import functools
+import os
+import sys
+import time
+
+import numpy as np
+
+# Switchable instrumentation of property table lookups
+# While a probe is enabled every PropertyTable lookup records, per call
+# site and station, the call count, cumulative time and a histogram of
+# the queried input values over the table range. While disabled a lookup
+# only pays one global check.
+
+# Active probe, None while instrumentation is off
+probe = None
+
+# Histogram bins across the table range, plus one below and one above
+HISTOGRAM_BINS = 20
+
+# Helper functions skipped when finding the call site, so a lookup made
+# through interp or k_interp (or the stage_graph helpers and status
+# wrappers) is recorded at the line that called them
+SKIP_FUNCTIONS = frozenset(('interp', 'k_interp', 'specHeat', 'spec_heat', 'table_interp', 'table_state',
+                            'isentropic', 'gas_temperature', 'gas_spec_heat', 'lookup', 'lookup_many'))
+_SKIP_FILES = frozenset(('lookup_stats.py', 'prop_tables.py'))
+
+
+# Statistics of one (call site, station, table input, lookup) key
+class SiteStats:
+
+    def __init__(self, edges):
+        self.count = 0
+        self.values = 0
+        self.seconds = 0.0
+        self.edges = edges
+        # counts[0] below the table, counts[-1] above it
+        self.counts = np.zeros(len(edges) + 1, dtype=np.int64)
+
+
+class Probe:
+
+    def __init__(self, bins=HISTOGRAM_BINS, skip=SKIP_FUNCTIONS):
+        self.bins = bins
+        self.skip = frozenset(skip)
+        self.station = None
+        self.stats = {}
+
+    # First frame outside the table layer and the skipped helpers
+    def call_site(self):
+        frame = sys._getframe(3)
+        while frame is not None and (os.path.basename(frame.f_code.co_filename) in _SKIP_FILES
+                                     or frame.f_code.co_name in self.skip):
+            frame = frame.f_back
+        if frame is None:
+            return '?'
+        code = frame.f_code
+        return '%s:%d %s' % (os.path.basename(code.co_filename), frame.f_lineno, code.co_name)
+
+    def record(self, table, col_in, lookup, val, seconds):
+        key = (self.call_site(), self.station, table.names[col_in], lookup)
+        stats = self.stats.get(key)
+        if stats is None:
+            x = table.array[:, col_in]
+            edges = np.linspace(min(x[0], x[-1]), max(x[0], x[-1]), self.bins + 1)
+            stats = self.stats[key] = SiteStats(edges)
+
+        val = np.ravel(val)
+        bins = np.searchsorted(stats.edges, val, side='right')
+        bins[val == stats.edges[-1]] = self.bins
+        stats.count += 1
+        stats.values += len(val)
+        stats.seconds += seconds
+        stats.counts += np.bincount(bins, minlength=len(stats.counts))
+
+    # Keys and their statistics, slowest first
+    def rows(self):
+        return sorted(self.stats.items(), key=lambda item: -item[1].seconds)
+
+    # One line per key, slowest first, histograms=True appends histograms()
+    def report(self, histograms=False):
+        lines = ['%-36s %-8s %-6s %-12s %8s %10s %10s %8s %8s' % (
+            'call site', 'station', 'input', 'lookup', 'calls', 'values', 'time (s)', 'below', 'above')]
+        for (site, station, name, lookup), stats in self.rows():
+            lines.append('%-36s %-8s %-6s %-12s %8d %10d %10.6f %8d %8d' % (
+                site, station or '-', name, lookup, stats.count, stats.values, stats.seconds,
+                stats.counts[0], stats.counts[-1]))
+        if histograms:
+            lines.extend(('', self.histograms()))
+        return '\n'.join(lines)
+
+    # Histogram of the queried input values of every key, slowest first
+    # One line per bin, value range, count and a bar scaled to the key's
+    # fullest bin, the first and last lines count values outside the table
+    def histograms(self, width=40):
+        lines = []
+        for (site, station, name, lookup), stats in self.rows():
+            edges = stats.edges
+            labels = (['below %.6g' % edges[0]]
+                      + ['%.6g - %.6g' % (lo, hi) for lo, hi in zip(edges[:-1], edges[1:])]
+                      + ['above %.6g' % edges[-1]])
+            peak = max(stats.counts.max(), 1)
+            lines.append('%s  station %s  %s %s' % (site, station or '-', name, lookup))
+            for label, count in zip(labels, stats.counts):
+                lines.append('  %-24s %10d %s' % (label, count, '#' * int(round(width * count / peak))))
+        return '\n'.join(lines)
+
+
+# Decorator for PropertyTable lookup methods taking (val, col_in, ...)
+def instrumented(method):
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(table, val, col_in, *args, **kwargs):
+        if probe is None:
+            return method(table, val, col_in, *args, **kwargs)
+        start = time.perf_counter()
+        out = method(table, val, col_in, *args, **kwargs)
+        probe.record(table, col_in, name, val, time.perf_counter() - start)
+        return out
+    return wrapper
+
+
+def enable(bins=HISTOGRAM_BINS, skip=SKIP_FUNCTIONS):
+    global probe
+    probe = Probe(bins, skip)
+    return probe
+
+
+def disable():
+    global probe
+    stopped, probe = probe, None
+    return stopped
+
+
+# Record lookups made inside the block, yields the probe
+@contextlib.contextmanager
+def instrument(bins=HISTOGRAM_BINS, skip=SKIP_FUNCTIONS):
+    active = enable(bins, skip)
+    try:
+        yield active
+    finally:
+        disable()
+
+
+# Label the lookups that follow with a station name, e.g. 'S3'
+def set_station(name):
+    if probe is not None:
+        probe.station = name
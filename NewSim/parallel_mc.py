@@ -0,0 +1,196 @@
+import os
+import time
+
+import numpy as np
+
+try:
+    from . import prop_tables
+    from .prop_backends import property_backend, use_property_backend
+    from .stage_graph import shared_engine
+except ImportError:
+    import prop_tables
+    from prop_backends import property_backend, use_property_backend
+    from stage_graph import shared_engine
+
+# Parallel Monte Carlo over the PCM2 component efficiencies (shc_eff)
+# The sample budget is split into blocks of BLOCK samples. Each block draws
+# its own samples from a child of one SeedSequence, evaluates them in a
+# single batched pass of the PCM2 configuration (stage_graph.pcm2_engine)
+# and keeps only its statistics, count, mean, M2 (sum of squared
+# deviations), min and max per output, and how many samples left the
+# property tables. Workers run tasks of consecutive blocks, sized from runs
+# and workers so every worker gets several tasks, and return the block
+# statistics. These are merged pairwise (Chan et al.) in block order, so
+# results depend on the seed and block size but not on the number of
+# worker processes, and only a few floats per block cross the process
+# boundary.
+
+# Efficiency distributions, (mean, sd), means are the GTBA averages
+# Draws are capped at 1
+EFFICIENCIES = {
+    'eff_comp': (0.675, 0.02),
+    'eff_comb': (0.925, 0.02),
+    'eff_turb': (0.725, 0.02),
+    'eff_nozz': (1.0, 0.0),
+}
+
+# shc_eff return values
+MC_OUTPUTS = ('v9', 'thrust', 't8', 'p8')
+
+BLOCK = 32768           # samples per random stream and statistics block
+TASKS_PER_WORKER = 4    # tasks per worker process, for load balance
+
+
+class RunningStats:
+
+    # Statistics of an empty sample with n_out outputs
+    def __init__(self, n_out):
+        self.count = 0
+        self.mean = np.zeros(n_out)
+        self.m2 = np.zeros(n_out)
+        self.min = np.full(n_out, np.inf)
+        self.max = np.full(n_out, -np.inf)
+        self.invalid = 0    # samples with a non-finite output, not counted
+        self.out_of_envelope = 0    # samples with extrapolated table lookups, counted
+
+    # Statistics of a (samples, outputs) block, rows with nan are invalid
+    # status: range status bits per sample (stage_graph run(status=True))
+    @classmethod
+    def from_samples(cls, data, status=None):
+        stats = cls(data.shape[1])
+        if status is not None:
+            stats.out_of_envelope = int(np.count_nonzero(status))
+        valid = np.all(np.isfinite(data), axis=1)
+        data = data[valid]
+        stats.invalid = len(valid) - len(data)
+        stats.count = len(data)
+        if stats.count:
+            stats.mean = data.mean(axis=0)
+            stats.m2 = ((data - stats.mean) ** 2).sum(axis=0)
+            stats.min = data.min(axis=0)
+            stats.max = data.max(axis=0)
+        return stats
+
+    # Adds another sample's statistics to this one
+    def merge(self, other):
+        n = self.count + other.count
+        if other.count:
+            delta = other.mean - self.mean
+            self.mean = self.mean + delta * (other.count / n)
+            self.m2 = self.m2 + other.m2 + delta ** 2 * (self.count * other.count / n)
+            self.min = np.minimum(self.min, other.min)
+            self.max = np.maximum(self.max, other.max)
+        self.count = n
+        self.invalid += other.invalid
+        self.out_of_envelope += other.out_of_envelope
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / self.count
+
+    @property
+    def sd(self):
+        return np.sqrt(self.var)
+
+
+# Worker start up, applies the parent's property backend and table choice
+# Spawned workers re-import the modules and would fall back to the defaults
+def _worker_setup(backend, dense):
+    use_property_backend(backend)
+    prop_tables.use_dense_tables(dense)
+
+
+# One block: draws size samples from seed, returns their RunningStats
+def run_block(seed, size, efficiencies=EFFICIENCIES, outputs=MC_OUTPUTS, variable_cp=False):
+    rng = np.random.default_rng(seed)
+    samples = {name: np.minimum(rng.normal(mean, sd, size), 1.0)
+               for name, (mean, sd) in efficiencies.items()}
+    with np.errstate(invalid='ignore'):
+        out, status = shared_engine('PCM2', variable_cp).run(tuple(outputs), status=True, **samples)
+    return RunningStats.from_samples(np.column_stack(out), status)
+
+
+# One task: consecutive blocks, returns the RunningStats of each block
+def run_task(seeds, sizes, efficiencies=EFFICIENCIES, outputs=MC_OUTPUTS, variable_cp=False):
+    return [run_block(seed, size, efficiencies, outputs, variable_cp) for seed, size in zip(seeds, sizes)]
+
+
+# Block ranges (lo, hi) of the tasks for n_blocks blocks on workers
+# processes, TASKS_PER_WORKER tasks per worker while there are enough blocks
+def task_bounds(n_blocks, workers):
+    n_tasks = min(n_blocks, workers * TASKS_PER_WORKER)
+    bounds = np.linspace(0, n_blocks, n_tasks + 1).astype(int)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+# runs samples of shc_eff over the efficiency distributions on workers
+# processes (None for every core, 1 evaluates in this process)
+# Returns the merged RunningStats, columns in outputs order
+def monte_carlo(runs, workers=None, seed=0, efficiencies=EFFICIENCIES, outputs=MC_OUTPUTS,
+                variable_cp=False, block=BLOCK):
+    if runs < 1:
+        raise ValueError("runs must be at least 1")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    sizes = [min(block, runs - start) for start in range(0, runs, block)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    # Workers start from a forkserver (spawn where there is none), a plain
+    # fork would copy the locks of threads running here, such as numba's
+    # parallel kernels, and can hang. They are set to this process's
+    # property backend and tables, and map the compiled table cache this
+    # process writes here.
+    backend = property_backend().name
+    shared_engine('PCM2', variable_cp)
+
+    if workers <= 1 or len(sizes) <= 1:
+        parts = run_task(seeds, sizes, efficiencies, outputs, variable_cp)
+    else:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            # The server imports this module once, workers fork from it ready
+            if __name__ != '__main__':
+                context.set_forkserver_preload([__name__])
+        else:
+            context = multiprocessing.get_context('spawn')
+        bounds = task_bounds(len(sizes), workers)
+        n_tasks = len(bounds)
+        tasks = ([seeds[lo:hi] for lo, hi in bounds], [sizes[lo:hi] for lo, hi in bounds],
+                 [efficiencies] * n_tasks, [outputs] * n_tasks, [variable_cp] * n_tasks)
+        with ProcessPoolExecutor(min(workers, n_tasks), context,
+                                 initializer=_worker_setup,
+                                 initargs=(backend, prop_tables.dense_default)) as pool:
+            parts = [part for task in pool.map(run_task, *tasks) for part in task]
+
+    stats = RunningStats(len(outputs))
+    for part in parts:
+        stats.merge(part)
+    return stats
+
+
+# Wall time of monte_carlo(runs) for each worker count
+# Returns {workers: (seconds, speedup over one worker)}
+def benchmark(runs=4000000, workers=None, block=BLOCK):
+    if workers is None:
+        workers = sorted({1, 2, 4, os.cpu_count() or 1})
+    times = {}
+    for n in workers:
+        start = time.perf_counter()
+        monte_carlo(runs, workers=n, block=block)
+        times[n] = time.perf_counter() - start
+    return {n: (sec, times[workers[0]] / sec) for n, sec in times.items()}
+
+
+def main():
+    stats = monte_carlo(1000000)
+    for name, mean, sd, lo, hi in zip(MC_OUTPUTS, stats.mean, stats.sd, stats.min, stats.max):
+        print('%-8s mean %12.6g  sd %12.6g  min %12.6g  max %12.6g' % (name, mean, sd, lo, hi))
+    print('%d samples, %d invalid, %d outside the property tables'
+          % (stats.count, stats.invalid, stats.out_of_envelope))
+
+
+if __name__ == '__main__':
+    main()
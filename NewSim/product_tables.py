@@ -0,0 +1,167 @@
+import numpy as np
+
+try:
+    from .prop_tables import (gas_table, shc_table, uniform_runs, run_index, T, H, CP, CV,
+                              MAX_UNIFORM_RUNS, ARITH_MIN_SIZE)
+except ImportError:
+    from prop_tables import (gas_table, shc_table, uniform_runs, run_index, T, H, CP, CV,
+                             MAX_UNIFORM_RUNS, ARITH_MIN_SIZE)
+
+# Two dimensional property tables of combustion products, indexed by an
+# input (temperature or enthalpy) and the fuel-air ratio f = mFuel / mAir
+# Every cell stores the coefficients of its bilinear patch
+#   v = c + cx dx + cf df + cxf dx df,  dx = x - x[i], df = f - f[j]
+# so a lookup is two index searches, four gathers and three multiply-adds,
+# close to the one dimensional air tables. Piecewise uniform x knots are
+# searched by arithmetic in large batches, like PropertyTable.index.
+# Lookups keep the caller's precision: float32 inputs use float32 copies
+# of the knots and coefficients, everything else float64.
+
+
+class ProductTable:
+
+    # x: (nx,) increasing input knots, f: (nf,) increasing fuel-air ratios,
+    # fields: {name: (nx, nf) values}, x_name: name of the input
+    def __init__(self, x, f, fields, x_name='T'):
+        self.x = np.array(x, dtype=float)
+        self.f = np.array(f, dtype=float)
+        self.x_name = x_name
+        self.fields = {name: np.array(val, dtype=float) for name, val in fields.items()}
+        if len(self.x) < 2 or len(self.f) < 2:
+            raise ValueError("a product table needs at least 2 x and 2 f knots")
+        for name, val in self.fields.items():
+            if val.shape != (len(self.x), len(self.f)):
+                raise ValueError("field %s has shape %s, expected %s"
+                                 % (name, val.shape, (len(self.x), len(self.f))))
+
+        # Fuel-air ratio grids are usually uniform, then the f index is found
+        # by arithmetic
+        firsts, starts, steps = uniform_runs(self.f)
+        self.f_step = steps[0] if len(firsts) == 1 else None
+        x_runs = uniform_runs(self.x)
+        self.x_runs = x_runs if len(x_runs[0]) <= MAX_UNIFORM_RUNS else None
+
+        self.inverses = {}
+        self.copies = {}
+
+        dx = np.diff(self.x)[:, None]
+        df = np.diff(self.f)[None, :]
+        self.coefficients = {}
+        for name, v in self.fields.items():
+            c = v[:-1, :-1]
+            cx = (v[1:, :-1] - c) / dx
+            cf = (v[:-1, 1:] - c) / df
+            cxf = (v[1:, 1:] - v[1:, :-1] - v[:-1, 1:] + c) / (dx * df)
+            # One contiguous (4, cells) block per field, cell = i * (nf - 1) + j
+            self.coefficients[name] = np.stack([c, cx, cf, cxf]).reshape(4, -1)
+
+    # Table arrays in dtype, (x, f, x runs, f step, coefficients), float32
+    # copies are rounded from the float64 arrays once and kept
+    def arrays(self, dtype):
+        if dtype == np.float64:
+            return self.x, self.f, self.x_runs, self.f_step, self.coefficients
+        arrays = self.copies.get(dtype)
+        if arrays is None:
+            cast = np.dtype(dtype).type
+            x_runs = None if self.x_runs is None else \
+                (self.x_runs[0], self.x_runs[1].astype(dtype), self.x_runs[2].astype(dtype))
+            f_step = None if self.f_step is None else cast(self.f_step)
+            coefficients = {name: c.astype(dtype) for name, c in self.coefficients.items()}
+            arrays = self.copies[dtype] = (self.x.astype(dtype), self.f.astype(dtype), x_runs, f_step,
+                                           coefficients)
+        return arrays
+
+    # Cell of each (x, f), values outside the table use the edge cells
+    def index(self, x, f, arrays=None):
+        xk, fk, x_runs, f_step, coefficients = arrays or self.arrays(np.float64)
+        if x_runs is None or np.size(x) < ARITH_MIN_SIZE:
+            i = np.searchsorted(xk, x) - 1
+        else:
+            i = run_index(x, x_runs)
+        i = np.clip(i, 0, len(xk) - 2)
+        if f_step is not None:
+            with np.errstate(invalid='ignore'):
+                j = np.floor((f - fk[0]) / f_step).astype(np.intp)
+        else:
+            j = np.searchsorted(fk, f) - 1
+        j = np.clip(j, 0, len(fk) - 2)
+        return i, j
+
+    # Fields at (x, f), scalars or arrays broadcast together, from one cell
+    # search. Returns one array per name in names, float32 when x and f are
+    # float32, float64 otherwise.
+    def lookup(self, x, f, names):
+        x, f = np.broadcast_arrays(np.asarray(x), np.asarray(f))
+        dtype = np.float32 if np.result_type(x, f) == np.float32 else np.float64
+        x, f = x.astype(dtype, copy=False), f.astype(dtype, copy=False)
+        arrays = self.arrays(dtype)
+        xk, fk, coefficients = arrays[0], arrays[1], arrays[4]
+
+        i, j = self.index(x, f, arrays)
+        cell = i * (len(fk) - 1) + j
+        dx = x - xk.take(i)
+        df = f - fk.take(j)
+
+        out = []
+        for name in names:
+            c, cx, cf, cxf = coefficients[name]
+            out.append(c.take(cell) + dx * cx.take(cell) + df * (cf.take(cell) + dx * cxf.take(cell)))
+        return tuple(out)
+
+    # Cp, cv and gamma at (T, f), needs cp and cv fields
+    def spec_heat(self, temp, f):
+        cp, cv = self.lookup(temp, f, ('cp', 'cv'))
+        return cp, cv, cp / cv
+
+    # Table keyed by field `name` (e.g. h) instead of x, giving x back
+    # Each f column is inverted on the union of the field's knots over the
+    # range all columns share, so the inversion is exact at every knot.
+    # Built once per field and kept.
+    def inverse(self, name):
+        if name in self.inverses:
+            return self.inverses[name]
+
+        v = self.fields[name]
+        if np.any(np.diff(v, axis=0) <= 0):
+            raise ValueError("field %s is not increasing in %s" % (name, self.x_name))
+
+        lo, hi = v[0].max(), v[-1].min()
+        knots = np.unique(v.ravel())
+        knots = knots[(knots >= lo) & (knots <= hi)]
+        inv = np.column_stack([np.interp(knots, v[:, j], self.x) for j in range(len(self.f))])
+        self.inverses[name] = ProductTable(knots, self.f, {self.x_name: inv}, x_name=name)
+        return self.inverses[name]
+
+
+# Product table with the air properties at every fuel-air ratio
+# Stand-in until measured product gas data are added, T knots are the union
+# of both air tables, fields h (kJ/kg), cp and cv (kJ/kgK). Reproduces the
+# air-only models exactly, so the mixed-gas path can be checked and timed.
+def air_product_table(f=np.linspace(0.0, 0.05, 11)):
+    gas = gas_table()
+    shc = shc_table()
+    temps = np.union1d(gas.array[:, T], shc.array[:, T])
+    h = gas.lookup(temps, T, H)
+    cp, cv = shc.lookup_many(temps, T, (CP, CV))
+    fields = {name: np.repeat(val[:, None], len(f), axis=1)
+              for name, val in (('h', h), ('cp', cp), ('cv', cv))}
+    return ProductTable(temps, f, fields)
+
+
+# Load a product table file: space separated rows of T f h cp cv, one row
+# per (T, f) grid point in any order
+def load_product_table(path):
+    rows = np.loadtxt(path, ndmin=2)
+    temps = np.unique(rows[:, 0])
+    f = np.unique(rows[:, 1])
+    if len(rows) != len(temps) * len(f):
+        raise ValueError("%s is not a full T x f grid" % path)
+
+    i = np.searchsorted(temps, rows[:, 0])
+    j = np.searchsorted(f, rows[:, 1])
+    fields = {}
+    for col, name in ((2, 'h'), (3, 'cp'), (4, 'cv')):
+        val = np.empty((len(temps), len(f)))
+        val[i, j] = rows[:, col]
+        fields[name] = val
+    return ProductTable(temps, f, fields)
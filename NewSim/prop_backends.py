@@ -0,0 +1,273 @@
+import functools
+import hashlib
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from .prop_tables import gas_table, shc_table, T, H, PR, CP, CV, GAMMA, GAS_PAIRS
+except ImportError:
+    from prop_tables import gas_table, shc_table, T, H, PR, CP, CV, GAMMA, GAS_PAIRS
+
+# Interchangeable thermodynamic property models
+# A backend is a pair of objects with the PropertyTable lookup signature,
+#   gas.lookup(val, col_in, col_out), gas.lookup_many(val, col_in, cols_out)
+#   over T, h and pr, gas.state(val, col_in), gas.isentropic(val,
+#   pressure_ratio, col_in) and shc.spec_heat(temp) -> cp, cv, gamma
+# so the cycle models run unchanged on any of them. Backends:
+#   tabulated    the property tables (prop_tables), the reference
+#   polynomial   least squares polynomials fitted to the tables
+#   constant_cp  calorically perfect air, cp and cv fixed at t_ref
+TABULATED = 'tabulated'
+POLYNOMIAL = 'polynomial'
+CONSTANT_CP = 'constant_cp'
+BACKENDS = (TABULATED, POLYNOMIAL, CONSTANT_CP)
+
+# Backend used when none is given, set per run with use_property_backend
+# or the environment variable, e.g. PJP_PROPERTY_BACKEND=constant_cp
+BACKEND_ENV = 'PJP_PROPERTY_BACKEND'
+backend_default = os.environ.get(BACKEND_ENV, TABULATED)
+
+POLY_DEGREE = 6
+T_REF = 300.0   # K, constant_cp reference temperature
+
+PropertyBackend = namedtuple('PropertyBackend', ['name', 'gas', 'shc'])
+
+
+def use_property_backend(name):
+    global backend_default
+    if name not in BACKENDS:
+        raise ValueError("backend must be one of %s" % (BACKENDS,))
+    backend_default = name
+
+
+# Active backend (or the named one) for values of the given dtype
+# The tabulated backend follows prop_tables.use_dense_tables
+def property_backend(name=None, dtype=np.float64):
+    name = backend_default if name is None else name
+    if name == TABULATED:
+        return PropertyBackend(name, gas_table(dtype), shc_table(dtype))
+    return _shared_backend(name, np.dtype(dtype))
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_backend(name, dtype):
+    if name == POLYNOMIAL:
+        return PropertyBackend(name, PolynomialGas(gas_table(), dtype=dtype),
+                               PolynomialShc(shc_table(), dtype=dtype))
+    if name == CONSTANT_CP:
+        cp, cv, gamma = shc_table().spec_heat(T_REF)
+        return PropertyBackend(name, ConstantCpGas(gas_table(), cp, cv, dtype=dtype),
+                               ConstantCpShc(cp, cv, dtype=dtype))
+    raise ValueError("backend must be one of %s" % (BACKENDS,))
+
+
+# Polynomial in x scaled to [-1, 1] over the fitted range, Horner evaluation
+class Polynomial:
+
+    def __init__(self, x, y, degree, dtype=np.float64):
+        dtype = np.dtype(dtype)
+        self.mid = dtype.type((x[0] + x[-1]) / 2)
+        self.half = dtype.type((x[-1] - x[0]) / 2)
+        self.coef = np.polynomial.polynomial.polyfit((x - self.mid) / self.half, y, degree).astype(dtype)
+
+    def __call__(self, val):
+        s = (val - self.mid) / self.half
+        out = self.coef[-1]
+        for c in self.coef[-2::-1]:
+            out = out * s + c
+        return out
+
+
+# state and isentropic for gas backends, from the backend's own lookup
+# States have the T, h and pr fields only, the table's u, vr and s0 columns
+# are not modelled. The isentrope is the table's, pr_out = pr_in *
+# pressure_ratio, so it uses each backend's pr (the fitted pr polynomial,
+# or T ** (cp / R) for constant cp).
+class GasBackend:
+
+    names = ('T', 'h', 'pr')
+
+    def state(self, val, col_in):
+        val = np.asarray(val, dtype=self.dtype)
+        out = np.empty(val.shape, dtype=[(name, self.dtype) for name in self.names])
+        for col, name in zip((T, H, PR), self.names):
+            out[name] = val if col == col_in else self.lookup(val, col_in, col)
+        return out
+
+    def isentropic(self, val, pressure_ratio, col_in=T):
+        pr_out = self.lookup(val, col_in, PR) * pressure_ratio
+        t_out, h_out = self.lookup_many(pr_out, PR, (T, H))
+        return t_out, h_out, pr_out
+
+
+# Gas table pairs as polynomials, pr is fitted as log(pr) on both sides
+# Accurate inside the table range, extrapolates the end polynomial outside
+class PolynomialGas(GasBackend):
+
+    def __init__(self, table, degree=POLY_DEGREE, pairs=GAS_PAIRS, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self.fits = {}
+        for col_in, col_out in pairs:
+            x = table.array[:, col_in].astype(np.float64)
+            y = table.array[:, col_out].astype(np.float64)
+            x = np.log(x) if col_in == PR else x
+            y = np.log(y) if col_out == PR else y
+            self.fits[(col_in, col_out)] = Polynomial(x, y, degree, self.dtype)
+        self.version = 'polynomial-%d-%s' % (degree, table.version)
+
+    def lookup(self, val, col_in, col_out):
+        fit = self.fits.get((col_in, col_out))
+        if fit is None:
+            raise ValueError("no fit for columns %d -> %d" % (col_in, col_out))
+        val = np.asarray(val, dtype=self.dtype)
+        out = fit(np.log(val) if col_in == PR else val)
+        return np.exp(out) if col_out == PR else out
+
+    def lookup_many(self, val, col_in, cols_out):
+        return tuple(self.lookup(val, col_in, col_out) for col_out in cols_out)
+
+
+# Specific heats as polynomials in T
+class PolynomialShc:
+
+    def __init__(self, table, degree=POLY_DEGREE, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        x = table.array[:, T].astype(np.float64)
+        self.cp = Polynomial(x, table.array[:, CP].astype(np.float64), degree, self.dtype)
+        self.cv = Polynomial(x, table.array[:, CV].astype(np.float64), degree, self.dtype)
+        self.version = 'polynomial-%d-%s' % (degree, table.version)
+
+    def lookup(self, val, col_in, col_out):
+        return self.lookup_many(val, col_in, (col_out,))[0]
+
+    def lookup_many(self, val, col_in, cols_out):
+        if col_in != T:
+            raise ValueError("specific heats are functions of T only")
+        cp, cv, gamma = self.spec_heat(val)
+        out = {CP: cp, CV: cv, GAMMA: gamma}
+        return tuple(out[col_out] for col_out in cols_out)
+
+    def spec_heat(self, temp):
+        temp = np.asarray(temp, dtype=self.dtype)
+        cp = self.cp(temp)
+        cv = self.cv(temp)
+        return cp, cv, cp / cv
+
+
+# Calorically perfect gas anchored to the table at t_ref
+#   h = h_ref + cp (T - t_ref),  pr = pr_ref (T / t_ref) ** (cp / R)
+class ConstantCpGas(GasBackend):
+
+    def __init__(self, table, cp, cv, t_ref=T_REF, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        h_ref, pr_ref = table.lookup_many(t_ref, T, (H, PR))
+        self.t_ref, self.h_ref, self.pr_ref = (self.dtype.type(v) for v in (t_ref, h_ref, pr_ref))
+        self.cp = self.dtype.type(cp)
+        self.exponent = self.dtype.type(cp / (cp - cv))
+        key = ('%r %r %r %r' % (t_ref, float(cp), float(cv), table.version)).encode()
+        self.version = 'constant_cp-' + hashlib.sha1(key).hexdigest()
+
+    def lookup(self, val, col_in, col_out):
+        val = np.asarray(val, dtype=self.dtype)
+        if col_in == T:
+            temp = val
+        elif col_in == H:
+            temp = self.t_ref + (val - self.h_ref) / self.cp
+        elif col_in == PR:
+            temp = self.t_ref * (val / self.pr_ref) ** (1 / self.exponent)
+        else:
+            raise ValueError("constant cp gas has columns T, h and pr only")
+
+        if col_out == T:
+            return temp
+        if col_out == H:
+            return self.h_ref + self.cp * (temp - self.t_ref)
+        if col_out == PR:
+            return self.pr_ref * (temp / self.t_ref) ** self.exponent
+        raise ValueError("constant cp gas has columns T, h and pr only")
+
+    def lookup_many(self, val, col_in, cols_out):
+        return tuple(self.lookup(val, col_in, col_out) for col_out in cols_out)
+
+
+class ConstantCpShc:
+
+    def __init__(self, cp, cv, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self.cp = self.dtype.type(cp)
+        self.cv = self.dtype.type(cv)
+        self.version = 'constant_cp-%r-%r' % (float(cp), float(cv))
+
+    def lookup(self, val, col_in, col_out):
+        return self.lookup_many(val, col_in, (col_out,))[0]
+
+    def lookup_many(self, val, col_in, cols_out):
+        if col_in != T:
+            raise ValueError("specific heats are functions of T only")
+        cp, cv, gamma = self.spec_heat(val)
+        out = {CP: cp, CV: cv, GAMMA: gamma}
+        return tuple(out[col_out] for col_out in cols_out)
+
+    def spec_heat(self, temp):
+        temp = np.asarray(temp, dtype=self.dtype)
+        cp = np.full_like(temp, self.cp)
+        cv = np.full_like(temp, self.cv)
+        return cp, cv, cp / cv
+
+
+# Speed and accuracy of every backend on every lookup
+# n random inputs over each table's range, best of repeat timings
+# Returns {(backend, lookup): (ns per lookup, max abs error, rms error)}
+# with errors against the tabulated backend
+def benchmark(n=100000, repeat=5, backends=BACKENDS, seed=0):
+    rng = np.random.default_rng(seed)
+    gas = gas_table()
+    shc = shc_table()
+    names = dict(zip((T, H, PR), ('T', 'h', 'pr')))
+
+    cases = []
+    for col_in, col_out in GAS_PAIRS:
+        x = gas.array[:, col_in]
+        val = rng.uniform(x[0], x[-1], n)
+        cases.append(('%s -> %s' % (names[col_in], names[col_out]), 'gas', val,
+                      lambda props, val, col_in=col_in, col_out=col_out:
+                      props.gas.lookup(val, col_in, col_out)))
+    for col_out, name in ((CP, 'cp'), (GAMMA, 'gamma')):
+        val = rng.uniform(shc.array[0, T], shc.array[-1, T], n)
+        cases.append(('T -> %s' % name, 'shc', val,
+                      lambda props, val, col_out=col_out:
+                      props.shc.spec_heat(val)[(CP, CV, GAMMA).index(col_out)]))
+
+    reference = property_backend(TABULATED)
+    results = {}
+    for name in backends:
+        props = property_backend(name)
+        for label, table, val, call in cases:
+            expected = call(reference, val)
+            best = np.inf
+            for _ in range(repeat):
+                start = time.perf_counter()
+                out = call(props, val)
+                best = min(best, time.perf_counter() - start)
+            err = out - expected
+            # pr spans four decades, compare it relative to the table
+            if label.endswith('pr'):
+                err = err / expected
+            results[(name, label)] = (best / n * 1e9, float(np.max(np.abs(err))),
+                                      float(np.sqrt(np.mean(err ** 2))))
+    return results
+
+
+# One line per backend and lookup, pr errors are relative
+def benchmark_report(results):
+    lines = ['%-12s %-12s %12s %12s %12s' % ('backend', 'lookup', 'ns/lookup', 'max error', 'rms error')]
+    for (name, label), (ns, max_err, rms_err) in results.items():
+        lines.append('%-12s %-12s %12.2f %12.3g %12.3g' % (name, label, ns, max_err, rms_err))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    print(benchmark_report(benchmark()))
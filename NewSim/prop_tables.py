@@ -0,0 +1,701 @@
+import functools
+import hashlib
+import io
+import mmap
+import os
+import time
+import warnings
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+try:
+    from .lookup_stats import instrumented
+except ImportError:
+    from lookup_stats import instrumented
+
+# Ideal gas properties table columns (ideal_gas_prop.csv)
+T = 0   # temperature, K
+H = 1   # enthalpy, kJ/kg
+PR = 2  # relative pressure
+U = 3   # internal energy, kJ/kg
+VR = 4  # relative volume
+S0 = 5  # entropy function, kJ/kgK
+
+# Specific heat table columns (shc_air.csv), temperature is column 0
+CP = 1      # kJ/kgK
+CV = 2      # kJ/kgK
+GAMMA = 3   # unitless
+
+# Field names of the structured arrays returned by PropertyTable.state
+GAS_COLUMNS = ('T', 'h', 'pr', 'u', 'vr', 's0')
+SHC_COLUMNS = ('T', 'cp', 'cv', 'gamma')
+
+# Input / output column pairs used by the cycle models
+GAS_PAIRS = ((T, H), (H, T), (T, PR), (PR, T), (H, PR), (PR, H))
+SHC_PAIRS = ((T, CP), (T, CV))
+
+# Out of range policies for lookups
+EXTRAPOLATE = 'extrapolate'  # extend the first or last table segment
+CLAMP = 'clamp'              # hold the first or last table value
+NAN = 'nan'                  # return nan
+POLICIES = (EXTRAPOLATE, CLAMP, NAN)
+
+# Interpolation methods
+LINEAR = 'linear'            # piecewise linear between table rows
+PCHIP = 'pchip'              # monotone piecewise cubic, smooth derivative
+
+# Lookup status bits, one uint8 per looked up value
+IN_RANGE = 0
+BELOW_RANGE = 1
+ABOVE_RANGE = 2
+INVALID_INPUT = 4            # nan input
+
+# Table data ships next to this module, so lookups never depend on the cwd
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+GAS_TABLE_CSV = os.path.join(DATA_DIR, 'ideal_gas_prop.csv')
+SHC_TABLE_CSV = os.path.join(DATA_DIR, 'shc_air.csv')
+
+# Compiled table cache, bump CACHE_FORMAT whenever the block layout changes
+# File layout: CACHE_MAGIC, format and block shape as little endian int64,
+# then the block as little endian float64
+CACHE_FORMAT = 2
+CACHE_MAGIC = b'PJPTABLE'
+CACHE_HEADER = 32
+CACHE_DIR = os.path.join(DATA_DIR, '__tablecache__')
+
+# Dense uniform grids (PropertyTable.resampled), target worst case error
+# relative to the table output values and memory budget per table
+DENSE_TARGET_ERROR = 1e-6
+DENSE_BUDGET = 4 * 2**20     # bytes
+
+# Largest number of uniform runs an input column can have and still have
+# its segment index found by arithmetic instead of a binary search, and the
+# smallest batch for which that is faster (see benchmark). Every run costs
+# one compare pass, 16 runs are still well ahead of a binary search.
+MAX_UNIFORM_RUNS = 16
+ARITH_MIN_SIZE = 2048
+
+
+# Split a knot column into runs of equal spacing
+# Returns the first knot index, start value and step of every run
+def uniform_runs(x):
+    dx = np.diff(x)
+    new_run = np.ones(len(dx), dtype=bool)
+    new_run[1:] = np.abs(dx[1:] - dx[:-1]) > 1e-9 * np.abs(dx[:-1])
+    firsts = np.flatnonzero(new_run)
+    return firsts, x[firsts], dx[firsts]
+
+
+# Segment index of an array of values by arithmetic on the knots' uniform
+# runs: the run containing each value, then the offset within the run.
+# Values outside the knots (and nan) give indices the caller has to clip.
+def run_index(val, runs):
+    firsts, starts, steps = runs
+    r = np.zeros(val.shape, dtype=np.intp)
+    for start in starts[1:]:
+        r += val >= start
+    with np.errstate(invalid='ignore'):
+        return firsts[r] + np.floor((val - starts[r]) / steps[r]).astype(np.intp)
+
+
+# Piecewise linear property table
+# Slopes and intercepts of every table segment are built once for each
+# (input column, output column) pair, so a lookup is one index search
+# and one multiply-add
+# index_mode 'auto' finds the segment of piecewise uniform input columns
+# (the temperature columns) in large batches by arithmetic on their runs and
+# uses a binary search for scalars, small batches and the other columns
+# (h, pr), 'search' always uses a binary search
+# All table data lives in one read-only block (see compile_block), either
+# built in memory or memory mapped from the compiled table cache
+class PropertyTable:
+
+    def __init__(self, array, pairs, index_mode='auto', names=None):
+        block = compile_block(array, pairs)
+        block.setflags(write=False)
+        self.attach(block, pairs, index_mode, names)
+
+    # Table from a compiled block, such as a memory mapped cache file
+    @classmethod
+    def from_block(cls, block, pairs, index_mode='auto', names=None):
+        table = cls.__new__(cls)
+        table.attach(block, pairs, index_mode, names)
+        return table
+
+    def attach(self, block, pairs, index_mode, names):
+        if index_mode not in ('auto', 'search'):
+            raise ValueError("index_mode must be 'auto' or 'search'")
+
+        n_cols = block.shape[0] - ROWS_PER_PAIR * len(pairs)
+        n_seg = block.shape[1] - 1
+        if names is None:
+            names = tuple('c%d' % col for col in range(n_cols))
+        if len(names) != n_cols:
+            raise ValueError("expected %d column names, got %d" % (n_cols, len(names)))
+
+        self.block = block
+        self.pairs = tuple(pairs)
+        self.array = block[:n_cols].T
+        self.names = tuple(names)
+        self.dtype = block.dtype
+        self.index_mode = index_mode
+        self.state_dtype = np.dtype([(name, self.dtype) for name in self.names])
+        # Row differences of every column, used by state lookups
+        self.deltas = np.diff(self.array, axis=0)
+        # Content hash, changes whenever the table data changes
+        self.version = hashlib.sha1(block).hexdigest()
+        self.knots = {}
+        self.runs = {}
+        self.segments = {}
+        self.cubics = {}
+        # Dense uniform grids, empty unless built by resampled()
+        self.dense = {}
+        self.dense_knots = {}
+        self.dense_segments = {}
+        self.dense_error = {}
+        self.dense_params = None
+
+        for k, (col_in, col_out) in enumerate(self.pairs):
+            row = n_cols + ROWS_PER_PAIR * k
+            self.knots[col_in] = block[col_in]
+            self.segments[(col_in, col_out)] = (block[row, :n_seg], block[row + 1, :n_seg])
+            self.cubics[(col_in, col_out)] = tuple(block[row + 2:row + 5, :n_seg])
+
+        for col_in, x in self.knots.items():
+            runs = uniform_runs(x)
+            if index_mode == 'auto' and len(runs[0]) <= MAX_UNIFORM_RUNS:
+                self.runs[col_in] = runs
+
+    # Copy of the table with its data and coefficients in another float
+    # dtype, e.g. float32 for bandwidth bound batches. Coefficients are
+    # computed in float64 and then rounded.
+    def astype(self, dtype):
+        if np.dtype(dtype) == self.dtype:
+            return self
+        block = self.block.astype(dtype)
+        block.setflags(write=False)
+        table = PropertyTable.from_block(block, self.pairs, self.index_mode, self.names)
+        if self.dense_params is not None:
+            table = table.resampled(*self.dense_params)
+        return table
+
+    # Copy of the table whose linear lookups use dense uniform grids
+    # Every pair is resampled onto a uniform grid of its input column, so
+    # forward and inverse lookups (T -> h and h -> T alike) are a multiply,
+    # a floor and a gather. Grids are refined until the worst case error
+    # against the table, relative to the output values, is below
+    # target_error, or the grids of the table would exceed budget bytes.
+    # dense_error holds the worst case error reached for every pair, pairs
+    # that stay above target_error within the budget give a RuntimeWarning.
+    # lookup, lookup_many, state and linear lookup_deriv use the grids,
+    # PCHIP lookups and the other state columns interpolate the table rows.
+    def resampled(self, target_error=DENSE_TARGET_ERROR, budget=DENSE_BUDGET):
+        table = PropertyTable.from_block(self.block, self.pairs, self.index_mode, self.names)
+        table.version = self.version + '-dense-%g-%d' % (target_error, budget)
+        table.dense_params = (target_error, budget)
+
+        by_input = {}
+        for col_in, col_out in self.pairs:
+            by_input.setdefault(col_in, []).append(col_out)
+        itemsize = 2 * self.dtype.itemsize * sum(map(len, by_input.values()))
+        max_cells = max(budget // itemsize, len(self.array) - 1)
+
+        for col_in, cols_out in by_input.items():
+            x = self.array[:, col_in].astype(np.float64)
+            ys = [self.array[:, col_out].astype(np.float64) for col_out in cols_out]
+            n, grid, errors = dense_grid(x, ys, target_error, max_cells)
+
+            dx = (x[-1] - x[0]) / n
+            xg = np.linspace(x[0], x[-1], n + 1)
+            table.dense[col_in] = (self.dtype.type(x[0]), self.dtype.type(1 / dx), n)
+            table.dense_knots[col_in] = xg.astype(self.dtype)
+            for col_out, yg, err in zip(cols_out, grid, errors):
+                slope = np.diff(yg) / dx
+                intercept = yg[:-1] - slope * xg[:-1]
+                table.dense_segments[(col_in, col_out)] = (slope.astype(self.dtype), intercept.astype(self.dtype))
+                table.dense_error[(col_in, col_out)] = err
+
+        missed = ['%s -> %s %.2g' % (self.names[col_in], self.names[col_out], err)
+                  for (col_in, col_out), err in table.dense_error.items() if err > target_error]
+        if missed:
+            warnings.warn("dense grids within %d bytes miss the target error %g: %s"
+                          % (budget, target_error, ', '.join(missed)), RuntimeWarning, stacklevel=2)
+        return table
+
+    # Knots, slopes and intercepts of the linear lookup col_in -> col_out,
+    # the dense grid's when the table has one, for compiled kernels
+    def linear_segments(self, col_in, col_out):
+        if col_in in self.dense:
+            return (self.dense_knots[col_in],) + self.dense_segments[(col_in, col_out)]
+        return (self.knots[col_in],) + self.segments[(col_in, col_out)]
+
+    # Dense grid cell of each input value, outside values use the end cells
+    def dense_index(self, val, col_in):
+        x0, inv_dx, n = self.dense[col_in]
+        with np.errstate(invalid='ignore'):
+            i = np.floor((val - x0) * inv_dx).astype(np.intp)
+        return np.clip(i, 0, n - 1)
+
+    # Segment index of each input value, values outside the table use the
+    # first or last table segment. Scalars give a Python int.
+    def index(self, val, col_in):
+        x = self.knots[col_in]
+        last = len(x) - 2
+
+        if np.ndim(val) == 0:
+            return min(max(int(x.searchsorted(val)) - 1, 0), last)
+
+        runs = self.runs.get(col_in)
+        if runs is None or val.size < ARITH_MIN_SIZE:
+            i = x.searchsorted(val) - 1
+        else:
+            i = run_index(val, runs)
+        return np.minimum(np.maximum(i, 0), last)
+
+    # Status bits of each input value against the table range
+    def range_status(self, val, col_in):
+        x = self.knots[col_in]
+        val = np.asarray(val, dtype=self.dtype)
+        status = (val < x[0]) * np.uint8(BELOW_RANGE)
+        status |= (val > x[-1]) * np.uint8(ABOVE_RANGE)
+        status |= np.isnan(val) * np.uint8(INVALID_INPUT)
+        return status
+
+    # Input value (scalar or array of any shape), input and output column
+    # policy sets what out of range values return, with status=True the
+    # status bits of every value are returned as well
+    def lookup(self, val, col_in, col_out, policy=EXTRAPOLATE, status=False, method=LINEAR):
+        if method == PCHIP:
+            out = self.lookup_deriv(val, col_in, col_out, PCHIP, policy)[0]
+            return (out, self.range_status(val, col_in)) if status else out
+
+        out = self.lookup_many(val, col_in, (col_out,), policy, status)
+        if status:
+            return out[0][0], out[1]
+        return out[0]
+
+    # Output values and their derivative d(out)/d(in) from one index search
+    # PCHIP values and derivatives are continuous across table rows, LINEAR
+    # returns the segment slope. Extrapolation continues linearly with the
+    # end derivative, clamped values have zero derivative.
+    @instrumented
+    def lookup_deriv(self, val, col_in, col_out, method=PCHIP, policy=EXTRAPOLATE):
+        if policy not in POLICIES:
+            raise ValueError("policy must be one of %s" % (POLICIES,))
+        if method not in (LINEAR, PCHIP):
+            raise ValueError("method must be '%s' or '%s'" % (LINEAR, PCHIP))
+
+        val = np.asarray(val, dtype=self.dtype)
+        x = self.knots[col_in]
+        query = np.clip(val, x[0], x[-1])
+        i = self.index(query, col_in)
+
+        if method == LINEAR:
+            if col_in in self.dense:
+                i = self.dense_index(query, col_in)
+                slope, intercept = self.dense_segments[(col_in, col_out)]
+            else:
+                slope, intercept = self.segments[(col_in, col_out)]
+            out = slope[i] * query + intercept[i]
+            dout = slope[i]
+        else:
+            c1, c2, c3 = self.cubics[(col_in, col_out)]
+            y = self.array[:, col_out]
+            dx = query - x[i]
+            out = y[i] + dx * (c1[i] + dx * (c2[i] + dx * c3[i]))
+            dout = c1[i] + dx * (2 * c2[i] + 3 * dx * c3[i])
+
+        outside = (val < x[0]) | (val > x[-1])
+        if policy == EXTRAPOLATE:
+            out = out + dout * (val - query)
+        elif policy == CLAMP:
+            dout = np.where(outside, 0.0, dout)
+        else:
+            out = np.where(outside, np.nan, out)
+            dout = np.where(outside, np.nan, dout)
+        return out, dout
+
+    # Several output columns at the same input values from one index search
+    @instrumented
+    def lookup_many(self, val, col_in, cols_out, policy=EXTRAPOLATE, status=False):
+        if policy not in POLICIES:
+            raise ValueError("policy must be one of %s" % (POLICIES,))
+
+        val = np.asarray(val, dtype=self.dtype)
+        x = self.knots[col_in]
+        query = np.clip(val, x[0], x[-1]) if policy == CLAMP else val
+        if col_in in self.dense:
+            i = self.dense_index(query, col_in)
+            segments = self.dense_segments
+        else:
+            i = self.index(query, col_in)
+            segments = self.segments
+
+        out = []
+        for col_out in cols_out:
+            slope, intercept = segments[(col_in, col_out)]
+            val_out = slope[i] * query + intercept[i]
+            if policy == NAN:
+                val_out = np.where((val < x[0]) | (val > x[-1]), np.nan, val_out)
+            out.append(val_out)
+        out = tuple(out)
+
+        if status:
+            return out, self.range_status(val, col_in)
+        return out
+
+    # Every table column at the given input values from one index search
+    # col_in may be any strictly monotone column (increasing or decreasing),
+    # returns a structured array with one field per column (self.names)
+    @instrumented
+    def state(self, val, col_in, policy=EXTRAPOLATE):
+        if policy not in POLICIES:
+            raise ValueError("policy must be one of %s" % (POLICIES,))
+
+        val = np.asarray(val, dtype=self.dtype)
+        x = self.array[:, col_in]
+        lo, hi = min(x[0], x[-1]), max(x[0], x[-1])
+        query = np.clip(val, lo, hi) if policy == CLAMP else val
+
+        if col_in in self.knots:
+            i = self.index(query, col_in)
+        else:
+            dx = self.deltas[:, col_in]
+            if np.all(dx > 0):
+                i = np.searchsorted(x, query) - 1
+            elif np.all(dx < 0):
+                i = np.searchsorted(-x, -query) - 1
+            else:
+                raise ValueError("column %d is not monotone" % col_in)
+            i = np.clip(i, 0, len(x) - 2)
+
+        # Position of each value within its segment, shared by all columns
+        ratio = (query - x[i]) / self.deltas[i, col_in]
+        if policy == NAN:
+            ratio = np.where((val < lo) | (val > hi), np.nan, ratio)
+
+        out = np.empty(val.shape, dtype=self.state_dtype)
+        for col, name in enumerate(self.names):
+            out[name] = self.array[i, col] + ratio * self.deltas[i, col]
+        out[self.names[col_in]] = np.where(np.isnan(ratio), np.nan, query)
+
+        # Columns with a dense grid from col_in match lookup on this table
+        if col_in in self.dense:
+            i = self.dense_index(query, col_in)
+            for (pair_in, col_out), (slope, intercept) in self.dense_segments.items():
+                if pair_in == col_in:
+                    val_out = slope[i] * query + intercept[i]
+                    out[self.names[col_out]] = np.where(np.isnan(ratio), np.nan, val_out)
+        return out
+
+    # Ideal gas table only
+    # Isentropic compression or expansion by pressure_ratio (p_out / p_in)
+    # from inlet T (col_in=T) or h (col_in=H), scalars or arrays broadcast
+    # together. Uses the tabulated relative pressure, pr_out = pr_in *
+    # pressure_ratio, which is exp(s0 / R) and so carries the variable
+    # specific heat of the s0 column. Returns exit T, h and pr.
+    def isentropic(self, val, pressure_ratio, col_in=T, policy=EXTRAPOLATE):
+        pr_out = self.lookup(val, col_in, PR, policy) * pressure_ratio
+        t_out, h_out = self.lookup_many(pr_out, PR, (T, H), policy)
+        return t_out, h_out, pr_out
+
+    # Specific heat table only
+    # Cp, cv and gamma at each temperature (scalar or array)
+    def spec_heat(self, temp, policy=EXTRAPOLATE, status=False):
+        out = self.lookup_many(temp, T, (CP, CV), policy, status)
+        if status:
+            (cp, cv), flags = out
+            return cp, cv, cp / cv, flags
+        cp, cv = out
+        return cp, cv, cp / cv
+
+
+# Knot derivatives of the monotone cubic (PCHIP) through x, y
+# Fritsch-Butland weighted harmonic mean of the neighbouring secant slopes
+# inside the table, shape preserving three point formula at the ends
+def pchip_slopes(x, y):
+    dx = np.diff(x)
+    m = np.diff(y) / dx
+    d = np.zeros(len(x))
+    if len(x) == 2:
+        d[:] = m[0]
+        return d
+
+    w1 = 2 * dx[1:] + dx[:-1]
+    w2 = dx[1:] + 2 * dx[:-1]
+    same_sign = m[:-1] * m[1:] > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d[1:-1] = np.where(same_sign, (w1 + w2) / (w1 / m[:-1] + w2 / m[1:]), 0.0)
+
+    for end, (h0, h1, m0, m1) in ((0, (dx[0], dx[1], m[0], m[1])),
+                                  (-1, (dx[-1], dx[-2], m[-1], m[-2]))):
+        de = ((2 * h0 + h1) * m0 - h0 * m1) / (h0 + h1)
+        if np.sign(de) != np.sign(m0):
+            de = 0.0
+        elif np.sign(m0) != np.sign(m1) and abs(de) > abs(3 * m0):
+            de = 3 * m0
+        d[end] = de
+    return d
+
+
+# Uniform grid over the range of x with the smallest number of cells
+# (doubling from 4 per table row, at most max_cells) for which linear
+# interpolation on the grid is within target_error of the table, relative
+# to the output values. The worst error of a piecewise linear grid against
+# a piecewise linear table is at the table rows, so only those are checked.
+# Returns the cell count, grid values of each ys and the errors reached.
+def dense_grid(x, ys, target_error, max_cells):
+    n = 4 * (len(x) - 1)
+    while True:
+        n = min(n, max_cells)
+        xg = np.linspace(x[0], x[-1], n + 1)
+        grid = [np.interp(xg, x, y) for y in ys]
+
+        i = np.clip(np.floor((x - x[0]) * (n / (x[-1] - x[0]))).astype(np.intp), 0, n - 1)
+        ratio = (x - xg[i]) / (xg[i + 1] - xg[i])
+        errors = []
+        for y, yg in zip(ys, grid):
+            approx = yg[i] + ratio * (yg[i + 1] - yg[i])
+            errors.append(float(np.max(np.abs(approx - y) / np.maximum(np.abs(y), 1e-300))))
+
+        if max(errors) <= target_error or n >= max_cells:
+            return n, grid, errors
+        n *= 2
+
+
+# Compile a table into one contiguous block
+# Rows are the table columns followed by ROWS_PER_PAIR rows for each pair:
+# linear slope and intercept, then the c1, c2, c3 PCHIP coefficients of
+# y = y[i] + c1 dx + c2 dx^2 + c3 dx^3 with dx = val - x[i]
+# Coefficient rows have one entry per segment and are zero padded
+ROWS_PER_PAIR = 5
+
+def compile_block(array, pairs):
+    array = np.asarray(array, dtype=float)
+    n_rows, n_cols = array.shape
+    block = np.zeros((n_cols + ROWS_PER_PAIR * len(pairs), n_rows))
+    block[:n_cols] = array.T
+
+    for k, (col_in, col_out) in enumerate(pairs):
+        x = array[:, col_in]
+        y = array[:, col_out]
+        dx = np.diff(x)
+
+        slope = np.diff(y) / dx
+        intercept = y[:-1] - slope * x[:-1]
+
+        d = pchip_slopes(x, y)
+        c2 = (3 * slope - 2 * d[:-1] - d[1:]) / dx
+        c3 = (d[:-1] + d[1:] - 2 * slope) / dx ** 2
+
+        row = n_cols + ROWS_PER_PAIR * k
+        block[row, :-1] = slope
+        block[row + 1, :-1] = intercept
+        block[row + 2, :-1] = d[:-1]
+        block[row + 3, :-1] = c2
+        block[row + 4, :-1] = c3
+
+    return block
+
+
+# Load a property table csv
+# The compiled block is cached in cache_dir as a binary file named by
+# the csv, a hash of the pairs and a hash of the csv contents, the pairs and
+# CACHE_FORMAT, so a changed csv never reuses a stale file. Cached blocks are memory mapped read-only,
+# which skips the text parse and shares pages between worker processes.
+# Writing a new block removes older cache files of the same csv and pairs,
+# the same csv loaded with other pairs keeps its own file.
+# cache_dir=None always parses the csv.
+def load_table(path, pairs, index_mode='auto', cache_dir=CACHE_DIR, names=None):
+    with open(path, 'rb') as csv:
+        raw = csv.read()
+
+    if cache_dir is None:
+        return PropertyTable(np.loadtxt(io.BytesIO(raw), delimiter=' '), pairs, index_mode, names)
+
+    key = hashlib.sha1(raw + repr((CACHE_FORMAT, tuple(pairs))).encode()).hexdigest()
+    pairs_key = hashlib.sha1(repr(tuple(pairs)).encode()).hexdigest()
+    prefix = '%s-%s-v' % (os.path.splitext(os.path.basename(path))[0], pairs_key[:8])
+    cache_path = os.path.join(cache_dir, '%s%d-%s.bin' % (prefix, CACHE_FORMAT, key[:16]))
+
+    try:
+        return PropertyTable.from_block(map_block(cache_path), pairs, index_mode, names)
+    except (OSError, ValueError):
+        pass
+
+    block = compile_block(np.loadtxt(io.BytesIO(raw), delimiter=' '), pairs)
+
+    # Write to a temporary file and rename, so concurrent workers never
+    # map a partly written file. A read-only cache dir just skips caching.
+    # tempfile is only needed here, it is imported late to keep imports fast.
+    import tempfile
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(CACHE_MAGIC)
+            tmp.write(np.array([CACHE_FORMAT, *block.shape], dtype='<i8').tobytes())
+            tmp.write(block.astype('<f8').tobytes())
+        os.replace(tmp_path, cache_path)
+        block = map_block(cache_path)
+    except OSError:
+        block.setflags(write=False)
+    else:
+        remove_stale(cache_dir, prefix, cache_path)
+
+    return PropertyTable.from_block(block, pairs, index_mode, names)
+
+
+# Remove cache files starting with prefix (csv name and pairs hash) other
+# than keep, left by an older csv or CACHE_FORMAT. Processes that still map
+# a removed file keep their pages, files that cannot be removed (e.g. locked
+# on Windows) are left.
+def remove_stale(cache_dir, prefix, keep):
+    for entry in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, entry)
+        if entry.startswith(prefix) and entry.endswith('.bin') and path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# Whether the shared tables are densely resampled when dense is not given,
+# see use_dense_tables
+dense_default = False
+
+
+# Make gas_table() and shc_table() return densely resampled tables (with
+# the default target error and budget), so every model's linear lookups
+# become constant time
+def use_dense_tables(enabled=True):
+    global dense_default
+    dense_default = enabled
+
+
+# Shared ideal gas properties table, loaded on first use, once per process
+# Other dtypes (float32) and dense versions are derived once from the
+# float64 table
+def gas_table(dtype=np.float64, dense=None):
+    return _shared_table('gas', np.dtype(dtype), dense_default if dense is None else dense)
+
+
+# Shared specific heat table, loaded on first use, once per process
+def shc_table(dtype=np.float64, dense=None):
+    return _shared_table('shc', np.dtype(dtype), dense_default if dense is None else dense)
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_table(name, dtype, dense=False):
+    if dense:
+        return _shared_table(name, dtype).resampled()
+    if dtype != np.float64:
+        return _shared_table(name, np.dtype(np.float64)).astype(dtype)
+    if name == 'gas':
+        return load_table(GAS_TABLE_CSV, GAS_PAIRS, names=GAS_COLUMNS)
+    return load_table(SHC_TABLE_CSV, SHC_PAIRS, names=SHC_COLUMNS)
+
+
+# Table dtype for a batch of values, float32 batches use float32 tables,
+# everything else float64
+def table_dtype(val):
+    return np.float32 if getattr(val, 'dtype', None) == np.float32 else np.float64
+
+
+# Memory map a compiled table cache file read-only
+def map_block(cache_path):
+    with open(cache_path, 'rb') as cache:
+        buf = mmap.mmap(cache.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buf) < CACHE_HEADER or buf[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+        raise ValueError("not a compiled table file: %s" % cache_path)
+    fmt, n_rows, n_cols = np.frombuffer(buf, dtype='<i8', count=3, offset=len(CACHE_MAGIC))
+    if fmt != CACHE_FORMAT or len(buf) != CACHE_HEADER + 8 * n_rows * n_cols:
+        raise ValueError("stale or truncated table file: %s" % cache_path)
+
+    return np.frombuffer(buf, dtype='<f8', offset=CACHE_HEADER).reshape(n_rows, n_cols)
+
+
+# Station 0 properties, the same for every evaluation at one ambient state
+AmbientState = namedtuple('AmbientState', ['t0', 'p0', 'h0', 'pr0', 'cp', 'cv', 'gamma'])
+
+
+# Bounded LRU cache of ambient station properties
+# Keyed on (t0, p0) and the versions of both tables, so loading changed
+# tables never returns stale properties
+class AmbientCache:
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.states = OrderedDict()
+
+    # Scalar ambient temperature (K) and pressure (kPa)
+    def get(self, t0, p0, gas_table, shc_table):
+        key = (float(t0), float(p0), gas_table.version, shc_table.version)
+
+        state = self.states.get(key)
+        if state is not None:
+            self.hits += 1
+            self.states.move_to_end(key)
+            return state
+
+        self.misses += 1
+        h0, pr0 = gas_table.lookup_many(t0, T, (H, PR))
+        cp, cv, gamma = shc_table.spec_heat(t0)
+        state = AmbientState(float(t0), float(p0), float(h0), float(pr0),
+                             float(cp), float(cv), float(gamma))
+
+        self.states[key] = state
+        if len(self.states) > self.maxsize:
+            self.states.popitem(last=False)
+        return state
+
+    def clear(self):
+        self.states.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Shared by all cycle models in the process
+ambient_cache = AmbientCache()
+
+
+# Time per T -> h lookup of index_mode 'search' and 'auto' gas tables, for
+# a scalar (size 0) and batches of random temperatures of each size, best
+# of repeat runs over about `values` looked up values
+# Returns {size: (search us per call, auto us per call)}
+def benchmark(sizes=(0, 1, 100, 1000, ARITH_MIN_SIZE, 10000, 1000000), values=200000, repeat=5, seed=0):
+    tables = [load_table(GAS_TABLE_CSV, GAS_PAIRS, index_mode, names=GAS_COLUMNS)
+              for index_mode in ('search', 'auto')]
+    x = tables[0].knots[T]
+    rng = np.random.default_rng(seed)
+
+    results = {}
+    for size in sizes:
+        val = float(rng.uniform(x[0], x[-1])) if size == 0 else rng.uniform(x[0], x[-1], size)
+        calls = max(1, values // max(size, 1))
+        times = []
+        for table in tables:
+            best = np.inf
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for _ in range(calls):
+                    table.lookup(val, T, H)
+                best = min(best, time.perf_counter() - start)
+            times.append(best / calls * 1e6)
+        results[size] = tuple(times)
+    return results
+
+
+def benchmark_report(results):
+    lines = ['%-10s %14s %14s %8s' % ('values', 'search (us)', 'auto (us)', 'speedup')]
+    for size, (search, auto) in results.items():
+        lines.append('%-10s %14.2f %14.2f %8.2f' % (size or 'scalar', search, auto, search / auto))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    print(benchmark_report(benchmark()))
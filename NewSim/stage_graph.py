@@ -0,0 +1,533 @@
+import functools
+import math
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from .cp_integrals import cp_integrals
+    from .lookup_stats import set_station
+    from .prop_backends import property_backend
+    from .prop_tables import ambient_cache, gas_table, shc_table, T, H, PR, IN_RANGE
+    from .station_record import StationRecord, FIELDS
+except ImportError:
+    from cp_integrals import cp_integrals
+    from lookup_stats import set_station
+    from prop_backends import property_backend
+    from prop_tables import ambient_cache, gas_table, shc_table, T, H, PR, IN_RANGE
+    from station_record import StationRecord, FIELDS
+
+# Engine cycles as a chain of stages acting on one batched gas state
+# The cycle models repeat the same station sequence, atmosphere (S0, S2),
+# compressor (S3), combustor (S4), turbine (S5) and nozzle (S8, S9), with
+# different property treatments. Here each stage is configured with its
+# treatment (model) and an Engine chains them. Engine.compile() checks the
+# chain once and binds every stage to its model method, it does not
+# generate code. The pipeline then evaluates the whole batch in one
+# vectorized NumPy pass per stage. Every input and parameter may be an
+# array, they broadcast together NumPy-style.
+# PCM1 - PCM4 are configurations (pcm1_engine ... pcm4_engine) and the
+# model entry points run them. jit_kernels._fuel_level is pcm4_engine
+# lowered by hand to one compiled loop, tests check the two agree.
+
+# Stage models
+PR_TABLE = 'pr'                 # isentropes through the table pr column (PCM1)
+ENTHALPY = 'enthalpy'           # table h and T, cp and gamma at one temperature (PCM4)
+CONSTANT_CP = 'constant_cp'     # cp held at one temperature per stage (PCM2, PCM3)
+VARIABLE_CP = 'variable_cp'     # cp integrated over the stage (cp_integrals)
+
+# Engine parameters and their defaults (PCM4 test conditions)
+PARAMS = {
+    'flow_fuel': 339.98,        # ml/min    fuel flow
+    'w_elec': 0.0,              # kW        electrical load
+    'eff_gen': 1.0,             # none      generator efficiency
+    'eff_comp': 0.675,          # none      GTBA
+    'eff_comb': 0.925,          # none      GTBA
+    'eff_turb': 0.725,          # none      GTBA
+    'eff_nozz': 1.0,            # none
+    'm_air': 0.23,              # kg/s      Jetcat
+    't0': 293.15,               # K         Test conditions
+    'p0': 101.3,                # kPa       Test conditions
+    'v0': 0.0,                  # km/hr     Static test conditions
+    'd_fuel': 821.0,            # kg/m^3    Kerosene
+    'lhv_fuel': 43.0 * 1000,    # kJ/kg     Kerosene
+    'press_comp': 2.9,          # none      Jetcat
+    'press_comb': 0.97,         # none      OK State
+}
+
+# Gas constant for the dynamic pressure exit velocity (PCM3 v9test)
+GAS_CONST_AIR = 0.28705         # kJ/kgK
+
+# Property lookups shared by the stages of one run, products is an
+# optional product_tables.ProductTable for the burnt gas (enthalpy model)
+Context = namedtuple('Context', ['gas', 'shc', 'cp_int', 'products'])
+
+
+# Gas or specific heat lookups of one evaluation that OR the range status
+# bits (prop_tables BELOW_RANGE, ABOVE_RANGE, INVALID_INPUT) of every input
+# into status. Ranges are the tabulated table's, whatever the backend, so
+# status marks the samples that left the property data. cp_integrals and
+# product table lookups have no status bits and are not checked.
+class RangeStatus:
+
+    def __init__(self, props, table):
+        self.props = props
+        self.table = table
+        self.status = IN_RANGE
+
+    def check(self, val, col_in):
+        self.status = self.status | self.table.range_status(val, col_in)
+
+    def lookup(self, val, col_in, col_out):
+        self.check(val, col_in)
+        return self.props.lookup(val, col_in, col_out)
+
+    def lookup_many(self, val, col_in, cols_out):
+        self.check(val, col_in)
+        return self.props.lookup_many(val, col_in, cols_out)
+
+    def spec_heat(self, temp):
+        self.check(temp, T)
+        return self.props.spec_heat(temp)
+
+
+# Burnt gas temperature at enthalpy h and its specific heats, from the
+# product table at the fuel-air ratio when the run has one
+def gas_temperature(s, ctx, h):
+    if ctx.products is None:
+        return ctx.gas.lookup(h, H, T)
+    return ctx.products.inverse('h').lookup(h, s['f'], ('T',))[0]
+
+
+def gas_spec_heat(s, ctx, temp):
+    if ctx.products is None:
+        return ctx.shc.spec_heat(temp)
+    return ctx.products.spec_heat(temp, s['f'])
+
+
+class Stage:
+
+    models = ()
+    station = None  # lookup_stats label of the stage's lookups
+    needs = ()      # state keys read, given by earlier stages
+    uses = ()       # optional state keys, must not be given by later stages
+    gives = ()      # state keys written
+
+    def __init__(self, model):
+        if model not in self.models:
+            raise ValueError("%s model must be one of %s" % (type(self).__name__, self.models))
+        self.model = model
+
+    # The model method, called with (state, context) for a whole batch
+    def step(self):
+        return getattr(self, self.model)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.model)
+
+
+# Electrical load on the shaft, w_shaft = w_elec / eff_gen
+class GeneratorLoad(Stage):
+
+    station = 'S00'
+    gives = ('w_shaft',)
+
+    def __init__(self):
+        self.model = None
+
+    def step(self):
+        return self.load
+
+    def load(self, s, ctx):
+        s['w_shaft'] = s['w_elec'] / s['eff_gen']
+
+    def __repr__(self):
+        return 'GeneratorLoad()'
+
+
+# S2 -> S3, compression by press_comp with efficiency eff_comp
+# w_comp is the actual compressor work, w_drive what the turbine has to
+# supply (w_comp plus the generator load). shaft_load=True also adds the
+# generator load to the compressor exit enthalpy (PCM4).
+class Compressor(Stage):
+
+    models = (PR_TABLE, ENTHALPY, CONSTANT_CP, VARIABLE_CP)
+    station = 'S3'
+    needs = ('t2', 'p2', 'h2', 'cp0', 'gamma0')
+    uses = ('w_shaft',)
+    gives = ('t3', 'p3', 'h3', 'w_comp_i', 'w_comp', 'w_drive')
+
+    def __init__(self, model, shaft_load=False):
+        Stage.__init__(self, model)
+        self.shaft_load = shaft_load
+
+    def finish(self, s, ctx, w_comp_i):
+        s['p3'] = s['press_comp'] * s['p2']
+        s['w_comp_i'] = w_comp_i
+        s['w_comp'] = w_comp_i / s['eff_comp']
+        s['w_drive'] = s['w_comp'] + s.get('w_shaft', 0.0)
+        s['h3'] = (s['w_drive'] if self.shaft_load else s['w_comp']) / s['m_air'] + s['h2']
+
+    def pr(self, s, ctx):
+        pr_3 = ctx.gas.lookup(s['t2'], T, PR) * s['press_comp']
+        self.finish(s, ctx, s['m_air'] * (ctx.gas.lookup(pr_3, PR, H) - s['h2']))
+        s['t3'] = ctx.gas.lookup(s['h3'], H, T)
+
+    def enthalpy(self, s, ctx):
+        gamma = s['gamma0']
+        t3i = s['t2'] * (s['press_comp'] ** ((gamma - 1) / gamma))
+        self.finish(s, ctx, s['m_air'] * (ctx.gas.lookup(t3i, T, H) - s['h2']))
+        s['t3'] = ctx.gas.lookup(s['h3'], H, T)
+
+    def constant_cp(self, s, ctx):
+        cp, gamma = s['cp0'], s['gamma0']
+        t3i = s['t2'] * (s['press_comp'] ** ((gamma - 1) / gamma))
+        self.finish(s, ctx, s['m_air'] * cp * (t3i - s['t2']))
+        s['t3'] = (s['w_drive'] if self.shaft_load else s['w_comp']) / (s['m_air'] * cp) + s['t2']
+
+    def variable_cp(self, s, ctx):
+        t3i = ctx.cp_int.isentropic(s['t2'], s['press_comp'])
+        self.finish(s, ctx, s['m_air'] * ctx.cp_int.delta_h(s['t2'], t3i))
+        s['t3'] = ctx.cp_int.heat(s['t2'], (s['h3'] - s['h2']))
+
+
+# S3 -> S4, fuel heat release eff_comb * lhv_fuel per kg fuel
+# mix=True mass weights the compressor air enthalpy, h4 = q / m_tot +
+# h3 / (1 + f), mix=False adds it unweighted (PCM1). The constant and
+# variable cp models use the enthalpy datum cp0 * t0 at ambient.
+class Combustor(Stage):
+
+    models = (ENTHALPY, CONSTANT_CP, VARIABLE_CP)
+    station = 'S4'
+    needs = ('t3', 'p3', 'h3')
+    gives = ('t4', 'p4', 'h4', 'q_fuel')
+
+    def __init__(self, model, mix=True):
+        Stage.__init__(self, model)
+        self.mix = mix
+
+    def finish(self, s):
+        s['p4'] = s['press_comb'] * s['p3']
+        s['q_fuel'] = s['m_fuel'] * s['lhv_fuel'] * s['eff_comb']
+        s['h4'] = s['q_fuel'] / s['m_tot'] + (s['h3'] / (1 + s['f']) if self.mix else s['h3'])
+
+    def enthalpy(self, s, ctx):
+        self.finish(s)
+        s['t4'] = gas_temperature(s, ctx, s['h4'])
+
+    def constant_cp(self, s, ctx):
+        self.finish(s)
+        f, t3 = s['f'], s['t3']
+        s['t4'] = (1 + (f * s['eff_comb'] * s['lhv_fuel']) / (s['cp0'] * t3)) * t3 / (1 + f)
+
+    def variable_cp(self, s, ctx):
+        self.finish(s)
+        datum = s['cp0'] * s['t0']
+        h3 = datum + ctx.cp_int.delta_h(s['t0'], s['t3'])
+        h4 = (h3 + s['f'] * s['eff_comb'] * s['lhv_fuel']) / (1 + s['f'])
+        s['t4'] = ctx.cp_int.heat(s['t0'], h4 - datum)
+
+
+# S4 -> S5, the turbine supplies the compressor (and generator) work
+# demand='actual' supplies w_drive, 'ideal' the isentropic compressor work
+# (PCM1). efficiency=True takes the enthalpy drop as work / eff_turb, False
+# as the work itself (PCM2, PCM3).
+class Turbine(Stage):
+
+    models = (PR_TABLE, ENTHALPY, CONSTANT_CP, VARIABLE_CP)
+    station = 'S5'
+    needs = ('t4', 'p4', 'h4', 'w_comp_i', 'w_drive')
+    gives = ('t5', 'p5', 'h5', 'w_turb', 'press_turb')
+
+    def __init__(self, model, demand='actual', efficiency=True):
+        Stage.__init__(self, model)
+        if demand not in ('actual', 'ideal'):
+            raise ValueError("demand must be 'actual' or 'ideal'")
+        self.demand = demand
+        self.efficiency = efficiency
+
+    # Specific enthalpy drop across the turbine, kJ/kg
+    def drop(self, s):
+        work = s['w_drive'] if self.demand == 'actual' else s['w_comp_i']
+        return work / (s['m_tot'] * s['eff_turb']) if self.efficiency else work / s['m_tot']
+
+    def finish(self, s):
+        s['p5'] = s['press_turb'] * s['p4']
+        s['w_turb'] = s['m_tot'] * (s['h4'] - s['h5'])
+
+    def pr(self, s, ctx):
+        s['h5'] = s['h4'] - self.drop(s)
+        t5, pr_5 = ctx.gas.lookup_many(s['h5'], H, (T, PR))
+        s['t5'] = t5
+        s['press_turb'] = pr_5 / ctx.gas.lookup(s['h4'], H, PR)
+        self.finish(s)
+
+    def enthalpy(self, s, ctx):
+        s['h5'] = s['h4'] - self.drop(s)
+        s['t5'] = gas_temperature(s, ctx, s['h5'])
+        cp, cv, gamma = gas_spec_heat(s, ctx, s['t4'])
+        s['press_turb'] = (s['t5'] / s['t4']) ** (gamma / (gamma - 1))
+        self.finish(s)
+
+    def constant_cp(self, s, ctx):
+        cp, cv, gamma = ctx.shc.spec_heat(s['t4'])
+        drop = self.drop(s)
+        s['h5'] = s['h4'] - drop
+        s['t5'] = s['t4'] - drop / cp
+        s['press_turb'] = (s['t5'] / s['t4']) ** (gamma / (gamma - 1))
+        self.finish(s)
+
+    def variable_cp(self, s, ctx):
+        drop = self.drop(s)
+        s['h5'] = s['h4'] - drop
+        s['t5'] = ctx.cp_int.heat(s['t4'], -drop)
+        s['press_turb'] = ctx.cp_int.pressure_ratio(s['t4'], s['t5'])
+        self.finish(s)
+
+
+# S5 -> S8 -> S9, nozzle expansion and thrust
+# S8 is the nozzle exit plane total state, t8 = eff_nozz * t5, S9 the static
+# exit state. expansion='ambient' expands from p8 to p0, 'turbine' by the
+# turbine pressure ratio (PCM1). thrust = m_tot * (v9 - v0).
+class Nozzle(Stage):
+
+    models = (PR_TABLE, ENTHALPY, CONSTANT_CP, VARIABLE_CP)
+    station = 'S8'
+    needs = ('t5', 'p5', 'h5', 'press_turb')
+    gives = ('t8', 'p8', 'h8', 't9', 'p9', 'h9', 'v9', 'v9_dynamic', 'thrust')
+
+    def __init__(self, model, expansion='ambient'):
+        Stage.__init__(self, model)
+        if expansion not in ('ambient', 'turbine'):
+            raise ValueError("expansion must be 'ambient' or 'turbine'")
+        self.expansion = expansion
+
+    def ratio(self, s):
+        return s['p0'] / s['p8'] if self.expansion == 'ambient' else s['press_turb']
+
+    def finish(self, s, dh):
+        s['v9'] = np.sqrt(2000 * dh)
+        s['h9'] = s['h8'] - dh
+        s['p9'] = s['p0']
+        s['thrust'] = s['m_tot'] * (s['v9'] - (s['v0'] * 1000 / 3600))
+        # Exit velocity from the dynamic pressure at the exit plane density,
+        # nan where p8 < p0, always computed but rarely asked for
+        density = s['p8'] / (GAS_CONST_AIR * s['t8'])
+        with np.errstate(invalid='ignore'):
+            s['v9_dynamic'] = np.sqrt(2000 * (s['p8'] - s['p0']) / density)
+
+    def start(self, s):
+        s['t8'] = s['eff_nozz'] * s['t5']
+        s['p8'] = s['p5']
+        s['h8'] = s['h5']
+
+    def pr(self, s, ctx):
+        self.start(s)
+        pr_9 = ctx.gas.lookup(s['h8'], H, PR) * self.ratio(s)
+        s['t9'], h9 = ctx.gas.lookup_many(pr_9, PR, (T, H))
+        self.finish(s, s['h8'] - h9)
+
+    def enthalpy(self, s, ctx):
+        self.start(s)
+        cp, cv, gamma = gas_spec_heat(s, ctx, s['t8'])
+        dh = cp * s['t8'] * (1 - (self.ratio(s) ** ((gamma - 1) / gamma)))
+        s['t9'] = s['t8'] - dh / cp
+        self.finish(s, dh)
+
+    constant_cp = enthalpy
+
+    def variable_cp(self, s, ctx):
+        self.start(s)
+        s['t9'] = ctx.cp_int.isentropic(s['t8'], self.ratio(s))
+        self.finish(s, ctx.cp_int.delta_h(s['t9'], s['t8']))
+
+
+class Engine:
+
+    # stages: chain of stages, params: overrides of PARAMS
+    def __init__(self, stages, **params):
+        unknown = set(params) - set(PARAMS)
+        if unknown:
+            raise ValueError("unknown parameters %s" % sorted(unknown))
+        self.stages = tuple(stages)
+        self.params = dict(PARAMS, **params)
+        self.pipeline = None
+
+    def __repr__(self):
+        return 'Engine(%s)' % ', '.join(map(repr, self.stages))
+
+    # Checks the chain and binds each stage to its model, once per engine
+    def compile(self):
+        if self.pipeline is None:
+            self.pipeline = Pipeline(self)
+        return self.pipeline
+
+    def run(self, outputs='thrust', stations=False, workers=1, record=None, products=None,
+            dtype=None, status=False, **inputs):
+        return self.compile().run(outputs, stations, workers, record, products, dtype, status, **inputs)
+
+
+class Pipeline:
+
+    # State keys set before the first stage (atmosphere, S0 and S2)
+    inlet = ('m_fuel', 'f', 'm_tot', 't0', 'p0', 'h0', 't2', 'p2', 'h2', 'cp0', 'gamma0')
+
+    def __init__(self, engine):
+        self.engine = engine
+        given = set(PARAMS) | set(self.inlet)
+        used = set()
+        for stage in engine.stages:
+            missing = [key for key in stage.needs if key not in given]
+            if missing:
+                raise ValueError("%r needs %s from an earlier stage" % (stage, ', '.join(missing)))
+            late = [key for key in stage.gives if key in used or key in given]
+            if late:
+                raise ValueError("%r gives %s, already given or used by an earlier stage"
+                                 % (stage, ', '.join(late)))
+            given.update(stage.gives)
+            used.update(stage.uses)
+        self.gives = frozenset(given)
+        self.steps = tuple((stage.station, stage.step()) for stage in engine.stages)
+        self.needs_cp_int = any(stage.model == VARIABLE_CP for stage in engine.stages)
+        self.takes_products = all(stage.model in (None, ENTHALPY) for stage in engine.stages)
+
+    # Gas state of a batch, {key: scalar or array}
+    # status=True also gives s['status'], the range status bits of every
+    # gas and specific heat table lookup of each sample ORed together
+    def evaluate(self, values, ctx, status=False):
+        s = dict(values)
+        s['m_fuel'] = s['d_fuel'] * s['flow_fuel'] / 10**6 / 60
+        s['f'] = s['m_fuel'] / s['m_air']
+        s['m_tot'] = s['m_fuel'] + s['m_air']
+
+        set_station('S0')
+        if np.ndim(s['t0']) == 0 and np.ndim(s['p0']) == 0:
+            ambient = ambient_cache.get(s['t0'], s['p0'], ctx.gas, ctx.shc)
+            s['h0'], s['cp0'], s['gamma0'] = ambient.h0, ambient.cp, ambient.gamma
+        if status:
+            ctx = ctx._replace(gas=RangeStatus(ctx.gas, gas_table()), shc=RangeStatus(ctx.shc, shc_table()))
+            # Cached ambient states skip the lookups, their inputs are checked here
+            ctx.gas.check(s['t0'], T)
+            ctx.shc.check(s['t0'], T)
+        if 'h0' not in s:
+            s['h0'] = ctx.gas.lookup(s['t0'], T, H)
+            s['cp0'], cv0, s['gamma0'] = ctx.shc.spec_heat(s['t0'])
+        s['t2'], s['p2'], s['h2'] = s['t0'], s['p0'], s['h0']
+
+        try:
+            for station, step in self.steps:
+                set_station(station)
+                step(s, ctx)
+        finally:
+            set_station(None)
+        if status:
+            s['status'] = ctx.gas.status | ctx.shc.status
+        return s
+
+    # outputs: a state key or a tuple of keys, or stations=True for a
+    # StationRecord (fields this engine does not give are nan). record: a
+    # StationRecord of the batch shape to fill and return instead. workers
+    # > 1 splits the batch into chunks evaluated on a thread pool.
+    # products: product gas table for the burnt gas, enthalpy model only.
+    # dtype: float32 or float64 tables and results, by default float32 when
+    # the array inputs are float32 (or the record's dtype).
+    # status=True returns (result, status), status holds the range status
+    # bits of each sample (uint8, batch shape), nonzero where a table lookup
+    # was outside the property data and extrapolated.
+    def run(self, outputs='thrust', stations=False, workers=1, record=None, products=None,
+            dtype=None, status=False, **inputs):
+        unknown = set(inputs) - set(PARAMS)
+        if unknown:
+            raise ValueError("unknown inputs %s" % sorted(unknown))
+        if products is not None and not self.takes_products:
+            raise ValueError("product gas tables need the %s model in every stage" % ENTHALPY)
+        stations = stations or record is not None
+        names = FIELDS if stations else ((outputs,) if isinstance(outputs, str) else tuple(outputs))
+        missing = [name for name in names if name not in self.gives and not stations]
+        if missing:
+            raise ValueError("this engine does not give %s" % ', '.join(missing))
+
+        values = dict(self.engine.params, **inputs)
+        # Parameters are mostly Python scalars, only the others can set the shape
+        arrays = [val for val in values.values() if not isinstance(val, (int, float))]
+        shape = np.broadcast_shapes(*(np.shape(val) for val in arrays)) if arrays else ()
+        if dtype is None and record is not None:
+            dtype = record.dtype
+        elif dtype is None:
+            arrays = [val for val in arrays if isinstance(val, (np.ndarray, np.generic))]
+            dtype = np.result_type(*arrays) if arrays else np.float64
+        dtype = np.dtype(np.float32 if dtype == np.float32 else np.float64)
+        props = property_backend(dtype=dtype)
+        ctx = Context(props.gas, props.shc, cp_integrals() if self.needs_cp_int else None, products)
+
+        if record is None:
+            record = StationRecord(shape, dtype) if stations else None
+        elif record.shape != shape:
+            raise ValueError("record has shape %s, the batch %s" % (record.shape, shape))
+        out = record.block if stations else np.empty((len(names),) + shape, dtype=dtype)
+        flags = np.empty(shape, dtype=np.uint8) if status else None
+
+        if workers <= 1 or len(shape) == 0:
+            s = self.evaluate(values, ctx, status)
+            for row, name in enumerate(names):
+                out[row] = s.get(name, np.nan)
+            if status:
+                flags[...] = s['status']
+        else:
+            n = math.prod(shape)
+            flat = {key: val if np.ndim(val) == 0 else np.broadcast_to(val, shape).reshape(-1)
+                    for key, val in values.items()}
+            rows = out.reshape(len(names), n)
+
+            def evaluate_chunk(chunk):
+                s = self.evaluate({key: val if np.ndim(val) == 0 else val[chunk]
+                                   for key, val in flat.items()}, ctx, status)
+                for row, name in enumerate(names):
+                    rows[row, chunk] = s.get(name, np.nan)
+                if status:
+                    flags.reshape(n)[chunk] = s['status']
+
+            from concurrent.futures import ThreadPoolExecutor
+            bounds = np.linspace(0, n, workers + 1).astype(int)
+            with ThreadPoolExecutor(workers) as pool:
+                list(pool.map(evaluate_chunk, [slice(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:])]))
+
+        if stations:
+            result = record
+        else:
+            result = out[0] if isinstance(outputs, str) else tuple(out)
+        return (result, flags) if status else result
+
+
+# The cycle models as stage configurations, run by PCM1.calc,
+# PCM2.shc_eff, PCM3.fuel_level_stations and PCM4.fuelLevelChain
+
+def pcm1_engine():
+    return Engine([Compressor(PR_TABLE), Combustor(ENTHALPY, mix=False),
+                   Turbine(PR_TABLE, demand='ideal'), Nozzle(PR_TABLE, expansion='turbine')],
+                  flow_fuel=80, t0=300)
+
+
+def pcm2_engine(variable_cp=False):
+    model = VARIABLE_CP if variable_cp else CONSTANT_CP
+    return Engine([Compressor(model), Combustor(model), Turbine(model, efficiency=False), Nozzle(model)],
+                  flow_fuel=390)
+
+
+def pcm3_engine(variable_cp=False):
+    return pcm2_engine(variable_cp)
+
+
+def pcm4_engine():
+    return Engine([GeneratorLoad(), Compressor(ENTHALPY, shaft_load=True), Combustor(ENTHALPY),
+                   Turbine(ENTHALPY), Nozzle(ENTHALPY)])
+
+
+ENGINES = {'PCM1': pcm1_engine, 'PCM2': pcm2_engine, 'PCM3': pcm3_engine, 'PCM4': pcm4_engine}
+
+
+# Compiled engine of a configuration, shared within the process, e.g.
+# shared_engine('PCM2', True) for the variable cp PCM2 model
+@functools.lru_cache(maxsize=None)
+def shared_engine(name, *args):
+    return ENGINES[name](*args).compile()
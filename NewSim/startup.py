@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+# Import time of the package modules, each measured in a fresh interpreter
+# so nothing is cached between runs. Reported in milliseconds on top of
+# importing numpy, which every module needs anyway.
+
+MODULES = ('NewSim.prop_tables', 'NewSim.prop_backends', 'NewSim.cp_integrals',
+           'NewSim.PCM1', 'NewSim.PCM2', 'NewSim.PCM3', 'NewSim.PCM4')
+
+# Budget for importing the compute core on top of numpy
+IMPORT_BUDGET_MS = 20.0
+
+_TIMER = '''
+import time
+start = time.perf_counter()
+import numpy
+mid = time.perf_counter()
+import %s
+print((time.perf_counter() - mid) * 1000, (mid - start) * 1000)
+'''
+
+
+# Best of repeat fresh imports of module, returns (module ms, numpy ms)
+def import_time(module, repeat=5):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', _TIMER % module], cwd=root,
+                             capture_output=True, text=True, check=True).stdout.split()
+        times = (float(out[-2]), float(out[-1]))
+        best = times if best is None or times[0] < best[0] else best
+    return best
+
+
+# {module: (module ms, numpy ms)} for every module
+def benchmark(modules=MODULES, repeat=5):
+    return {module: import_time(module, repeat) for module in modules}
+
+
+# One line per module, flags modules over budget_ms
+def benchmark_report(results, budget_ms=IMPORT_BUDGET_MS):
+    lines = ['%-22s %10s %10s' % ('module', 'import ms', 'numpy ms')]
+    for module, (ms, numpy_ms) in results.items():
+        lines.append('%-22s %10.2f %10.2f%s' % (module, ms, numpy_ms,
+                                                '  over budget' if ms > budget_ms else ''))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    print(benchmark_report(benchmark()))
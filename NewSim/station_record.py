@@ -0,0 +1,51 @@
+import numpy as np
+
+# Station states of a batched cycle evaluation as one struct-of-arrays block
+# Every field is one row of a single preallocated (fields, *shape) array, so
+# a batch run writes whole rows and analysis reads them without re-running
+# the model or building per sample tuples. Stations follow
+# engine_stations.txt (2 compressor inlet, 8 nozzle, 9 exit plane).
+
+STATIONS = (0, 2, 3, 4, 5, 8, 9)
+
+# Row order of the block, t (K), p (kPa), h (kJ/kg) per station, then
+# shaft, compressor and turbine work and fuel heat release (kW), exit
+# velocity (m/s) and thrust (N). jit_kernels writes rows in this order.
+FIELDS = ('t0', 'p0', 'h0',
+          't2', 'p2', 'h2',
+          't3', 'p3', 'h3',
+          't4', 'p4', 'h4',
+          't5', 'p5', 'h5',
+          't8', 'p8', 'h8',
+          't9', 'p9', 'h9',
+          'w_shaft', 'w_comp', 'w_turb', 'q_fuel', 'v9', 'thrust')
+FIELD_INDEX = {name: row for row, name in enumerate(FIELDS)}
+
+
+class StationRecord:
+
+    # Uninitialised record for a batch of the given shape
+    def __init__(self, shape, dtype=np.float64):
+        self.shape = tuple(shape) if np.ndim(shape) else (int(shape),)
+        self.dtype = np.dtype(dtype)
+        self.block = np.empty((len(FIELDS),) + self.shape, dtype=self.dtype)
+
+    # One field over the batch, a view into the block
+    def __getitem__(self, name):
+        return self.block[FIELD_INDEX[name]]
+
+    # t, p and h at a station, views into the block
+    def station(self, number):
+        if number not in STATIONS:
+            raise ValueError("station must be one of %s" % (STATIONS,))
+        row = FIELD_INDEX['t%d' % number]
+        return self.block[row], self.block[row + 1], self.block[row + 2]
+
+    # Write fields by name, scalars (e.g. ambient values) fill the whole row
+    def fill(self, **fields):
+        for name, val in fields.items():
+            self.block[FIELD_INDEX[name]] = val
+
+    # Flat (fields, samples) view, as the compiled kernels take it
+    def rows(self):
+        return self.block.reshape(len(FIELDS), -1)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from NewSim import PCM1, PCM2, PCM3, PCM4, lookup_stats
+from NewSim.prop_tables import ambient_cache, gas_table, T, H
+from NewSim.stage_graph import pcm2_engine
+
+
+def stations(probe):
+    return {station for (site, station, name, lookup) in probe.stats}
+
+
+# Every model's lookups carry the station of the stage making them, the
+# ambient ones included
+@pytest.mark.parametrize('run, expected', [
+    (PCM1.calc, {'S0', 'S3', 'S4', 'S5', 'S8'}),
+    (lambda: PCM2.shc_eff(0.675, 0.925, 0.725, 1), {'S0', 'S5', 'S8'}),
+    (lambda: PCM3.fuel_level(390), {'S0', 'S5', 'S8'}),
+    (lambda: PCM4.fuelLevelChain(np.linspace(200, 390, 5), 0.5, 0.5), {'S0', 'S3', 'S4', 'S5', 'S8'}),
+])
+def test_model_lookups_are_labelled(run, expected):
+    ambient_cache.clear()
+    with lookup_stats.instrument() as probe:
+        run()
+    assert stations(probe) == expected
+    assert lookup_stats.probe is None
+
+
+def test_pcm4_kernel_ambient_lookups_are_labelled():
+    if not PCM4.kernels().HAVE_NUMBA:
+        pytest.skip("numba not installed")
+    ambient_cache.clear()
+    with lookup_stats.instrument() as probe:
+        PCM4.fuelLevelBatch(np.linspace(200, 390, 5), 0.5, 0.5, backend='numba')
+        gas_table().lookup(300.0, T, H)
+    assert stations(probe) == {'S0', None}
+
+
+def test_station_is_reset_when_a_stage_fails():
+    with lookup_stats.instrument() as probe:
+        with pytest.raises(Exception):
+            pcm2_engine().run('thrust', eff_comp=np.array(['bad']))
+        assert probe.station is None
+
+
+def test_histograms_cover_every_value():
+    with lookup_stats.instrument(bins=4) as probe:
+        gas_table().lookup(np.array([100.0, 250.0, 700.0, 1240.0, 2000.0]), T, H)
+    (key, stats), = probe.stats.items()
+    assert list(stats.counts) == [1, 1, 1, 0, 1, 1]
+    lines = probe.histograms().splitlines()
+    assert len(lines) == 1 + 4 + 2
+    assert lines[1].split()[:3] == ['below', '200', '1']
+    assert lines[3].split()[:4] == ['460', '-', '720', '1']
+    assert lines[4].split() == ['720', '-', '980', '0']
+    assert lines[-1].split()[:3] == ['above', '1240', '1']
+    assert probe.histograms() in probe.report(histograms=True)
+    assert probe.histograms() not in probe.report()
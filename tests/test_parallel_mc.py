@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+from NewSim import parallel_mc
+from NewSim.parallel_mc import RunningStats, monte_carlo
+
+
+def test_runs_must_be_positive():
+    for runs in (0, -5):
+        with pytest.raises(ValueError):
+            monte_carlo(runs, workers=1)
+
+
+# Block statistics are merged in block order whatever the worker count
+def test_workers_give_identical_statistics():
+    single = monte_carlo(50000, workers=1, block=4096)
+    pooled = monte_carlo(50000, workers=3, block=4096)
+    assert single.count + single.invalid == 50000
+    assert (pooled.count, pooled.invalid, pooled.out_of_envelope) == \
+        (single.count, single.invalid, single.out_of_envelope)
+    for name in ('mean', 'sd', 'min', 'max'):
+        assert_array_equal(getattr(pooled, name), getattr(single, name), err_msg=name)
+
+
+def test_block_size_changes_only_the_draws():
+    small = monte_carlo(20000, workers=1, block=1000)
+    large = monte_carlo(20000, workers=1, block=20000)
+    assert_allclose(small.mean, large.mean, rtol=1e-2)
+    assert not np.array_equal(small.mean, large.mean)
+
+
+def test_merge_matches_single_pass():
+    rng = np.random.default_rng(0)
+    data = rng.normal([1.0, -200.0, 3e4], [0.1, 5.0, 1e3], (1000, 3))
+    data[[5, 500], 1] = np.nan
+    status = np.zeros(1000, dtype=np.uint8)
+    status[[7, 8, 900]] = 2
+
+    whole = RunningStats.from_samples(data, status)
+    merged = RunningStats(3)
+    for lo, hi in ((0, 1), (1, 400), (400, 400), (400, 1000)):
+        merged.merge(RunningStats.from_samples(data[lo:hi], status[lo:hi]))
+
+    assert (merged.count, merged.invalid, merged.out_of_envelope) == (998, 2, 3)
+    assert (whole.count, whole.invalid, whole.out_of_envelope) == (998, 2, 3)
+    for name in ('mean', 'var', 'min', 'max'):
+        assert_allclose(getattr(merged, name), getattr(whole, name), rtol=1e-12, err_msg=name)
+    valid = data[np.all(np.isfinite(data), axis=1)]
+    assert_allclose(whole.mean, valid.mean(axis=0), rtol=1e-12)
+    assert_allclose(whole.sd, valid.std(axis=0), rtol=1e-12)
+
+
+def test_tasks_are_sized_from_runs_and_workers():
+    assert parallel_mc.task_bounds(3, 8) == [(0, 1), (1, 2), (2, 3)]
+    bounds = parallel_mc.task_bounds(1000, 2)
+    assert len(bounds) == 2 * parallel_mc.TASKS_PER_WORKER
+    assert bounds[0][0] == 0 and bounds[-1][1] == 1000
+    assert all(hi == lo for (_, hi), (lo, _) in zip(bounds[:-1], bounds[1:]))
+    assert {hi - lo for lo, hi in bounds} == {125}
+
+
+# Workers must not be forked from a process running numba's thread pool
+def test_workers_start_after_parallel_kernels():
+    from NewSim import PCM4
+    if not PCM4.kernels().HAVE_NUMBA:
+        pytest.skip("numba not installed")
+    PCM4.fuelLevelBatch(np.linspace(200, 390, 64), 0.5, 0.5, backend='numba', parallel=True)
+    stats = monte_carlo(8192, workers=2, block=2048)
+    assert stats.count + stats.invalid == 8192
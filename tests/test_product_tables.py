@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+from NewSim.product_tables import ProductTable, air_product_table
+from NewSim.prop_tables import ARITH_MIN_SIZE
+
+
+@pytest.fixture(scope='module')
+def products():
+    return air_product_table()
+
+
+# Bilinear patch of one cell against the four corner values
+def test_lookup_is_bilinear_in_the_cell():
+    x = np.array([300.0, 400.0, 600.0])
+    f = np.array([0.0, 0.02, 0.04])
+    v = np.array([[1.0, 2.0, 4.0], [3.0, 5.0, 6.0], [7.0, 8.0, 9.0]])
+    table = ProductTable(x, f, {'v': v})
+    wx, wf = 0.25, 0.5
+    expected = ((1 - wx) * (1 - wf) * v[1, 1] + wx * (1 - wf) * v[2, 1]
+                + (1 - wx) * wf * v[1, 2] + wx * wf * v[2, 2])
+    assert_allclose(table.lookup(450.0, 0.03, ('v',))[0], expected, rtol=1e-14)
+    assert_allclose(table.lookup(x[:, None], f[None, :], ('v',))[0], v, rtol=1e-14)
+
+
+# Large batches find the cell by arithmetic on the uniform runs of x
+def test_arithmetic_index_matches_search(products):
+    assert products.x_runs is not None
+    rng = np.random.default_rng(0)
+    x = rng.uniform(products.x[0] - 50, products.x[-1] + 50, 4 * ARITH_MIN_SIZE)
+    f = rng.uniform(0, 0.05, x.size)
+    batch = products.lookup(x, f, ('h', 'cp'))
+    small = [products.lookup(x[k:k + 100], f[k:k + 100], ('h', 'cp')) for k in range(0, x.size, 100)]
+    for col, name in enumerate(('h', 'cp')):
+        assert_allclose(batch[col], np.concatenate([part[col] for part in small]), rtol=1e-13, err_msg=name)
+
+
+def test_lookup_keeps_float32(products):
+    rng = np.random.default_rng(1)
+    temp = rng.uniform(300, 1400, 5000)
+    f = rng.uniform(0, 0.05, 5000)
+    single = products.spec_heat(temp.astype(np.float32), f.astype(np.float32))
+    double = products.spec_heat(temp, f)
+    assert all(val.dtype == np.float32 for val in single)
+    assert all(val.dtype == np.float64 for val in double)
+    assert all(val.dtype == np.float64 for val in products.spec_heat(temp.astype(np.float32), f))
+    for low, ref in zip(single, double):
+        assert_allclose(low, ref, rtol=1e-6)
+    inverse = products.inverse('h')
+    assert inverse.lookup(np.float32(900.0), np.float32(0.01), ('T',))[0].dtype == np.float32
+    assert_array_equal(products.lookup(np.array([300, 500]), np.array([0, 0]), ('h',))[0],
+                       products.lookup(np.array([300.0, 500.0]), 0.0, ('h',))[0])
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from NewSim import PCM1, prop_backends
+from NewSim.prop_backends import property_backend, use_property_backend, BACKENDS, TABULATED
+from NewSim.prop_tables import T, H, PR
+
+
+@pytest.fixture
+def backend():
+    default = prop_backends.backend_default
+    yield use_property_backend
+    use_property_backend(default)
+
+
+# Every backend's state and isentrope agree with its own lookups, round
+# trips through the separately fitted polynomial pairs are good to ~2e-4
+@pytest.mark.parametrize('name', BACKENDS)
+def test_state_and_isentropic_follow_lookup(name):
+    gas = property_backend(name).gas
+    temp = np.array([300.0, 650.0, 1100.0])
+    h, pr = gas.lookup_many(temp, T, (H, PR))
+    for col_in, val in ((T, temp), (H, h), (PR, pr)):
+        state = gas.state(val, col_in)
+        for col, field in ((T, 'T'), (H, 'h'), (PR, 'pr')):
+            expected = val if col == col_in else gas.lookup(val, col_in, col)
+            assert_allclose(state[field], expected, rtol=1e-12)
+        assert_allclose(state['T'], temp, rtol=1e-3)
+
+    t_out, h_out, pr_out = gas.isentropic(temp, 4.0)
+    assert_allclose(pr_out, 4 * pr, rtol=1e-12)
+    assert_allclose(t_out, gas.lookup(pr_out, PR, T), rtol=1e-12)
+    assert_allclose(h_out, gas.lookup(pr_out, PR, H), rtol=1e-12)
+    assert_allclose(gas.isentropic(h, 4.0, col_in=H), (t_out, h_out, pr_out), rtol=1e-3)
+
+
+# Constant cp isentrope is T_out = T_in * ratio ** ((gamma - 1) / gamma)
+def test_constant_cp_isentrope():
+    props = property_backend('constant_cp')
+    cp, cv, gamma = props.shc.spec_heat(300.0)
+    t_out = props.gas.isentropic(400.0, 5.0)[0]
+    assert_allclose(t_out, 400 * 5 ** ((gamma - 1) / gamma), rtol=1e-12)
+
+
+# PCM1's helpers run on the same backend as calc()
+@pytest.mark.parametrize('name', BACKENDS)
+def test_pcm1_helpers_follow_backend(backend, name):
+    backend(name)
+    gas = property_backend(name).gas
+    assert_allclose(PCM1.table_interp(900.0, T, H), gas.lookup(900.0, T, H), rtol=1e-15)
+    assert_allclose(PCM1.table_state(900.0, T)['pr'], gas.lookup(900.0, T, PR), rtol=1e-15)
+    assert_allclose(PCM1.isentropic(300.0, 4.0, T), gas.isentropic(300.0, 4.0, T), rtol=1e-15)
+    if name != TABULATED:
+        assert PCM1.table_state(900.0, T).dtype.names == ('T', 'h', 'pr')
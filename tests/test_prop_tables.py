@@ -0,0 +1,267 @@
+import os
+import shutil
+import warnings
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+from NewSim import prop_tables
+from NewSim.prop_tables import (load_table, map_block, remove_stale, gas_table, shc_table, GAS_TABLE_CSV, GAS_PAIRS, GAS_COLUMNS,
+                                ARITH_MIN_SIZE, T, H, PR, EXTRAPOLATE, CLAMP, NAN, LINEAR, PCHIP,
+                                IN_RANGE, BELOW_RANGE, ABOVE_RANGE, INVALID_INPUT)
+
+
+@pytest.fixture(scope='module')
+def tables():
+    return {index_mode: load_table(GAS_TABLE_CSV, GAS_PAIRS, index_mode, cache_dir=None, names=GAS_COLUMNS)
+            for index_mode in ('search', 'auto')}
+
+
+# Arithmetic segment search (large batches) and binary search have to
+# agree everywhere, including on knots, outside the table and for nan. On a
+# knot the two may pick either neighbouring segment, so segments are only
+# compared on the random draws.
+@pytest.mark.parametrize('size', [1, 10, ARITH_MIN_SIZE - 1, ARITH_MIN_SIZE, 100000])
+def test_index_modes_agree(tables, size):
+    x = tables['auto'].knots[T]
+    rng = np.random.default_rng(size)
+    val = rng.uniform(x[0] - 100, x[-1] + 100, size)
+    assert_array_equal(tables['auto'].index(val, T), tables['search'].index(val, T))
+    val[:min(size, len(x))] = x[:size]
+    if size > len(x):
+        val[len(x)] = np.nan
+    for col_out in (H, PR):
+        assert_allclose(tables['auto'].lookup(val, T, col_out), tables['search'].lookup(val, T, col_out),
+                        rtol=1e-14, equal_nan=True)
+
+
+def test_scalar_index_matches_batch(tables):
+    table = tables['auto']
+    x = table.knots[T]
+    for val in (x[0] - 50, x[0], 500.0, x[-1], x[-1] + 50, np.nan):
+        assert table.index(val, T) == table.index(np.array([val]), T)[0]
+
+
+def test_benchmark_reports_every_size():
+    results = prop_tables.benchmark(sizes=(0, 10), values=100, repeat=1)
+    assert set(results) == {0, 10}
+    assert all(search > 0 and auto > 0 for search, auto in results.values())
+
+
+# Out of range policies and status bits against hand computed table values
+# The gas table runs from 200 to 1240 K, the specific heat table from 250 to
+# 1500 K. Extrapolation continues the first or last table segment.
+GAS_T = np.array([150, 200, 1240, 1300, np.nan])
+GAS_H = {
+    EXTRAPOLATE: [149.97, 199.97, 1324.93, 1324.93 + 60 * (1324.93 - 1301.31) / 20, np.nan],
+    CLAMP: [199.97, 199.97, 1324.93, 1324.93, np.nan],
+    NAN: [np.nan, 199.97, 1324.93, np.nan, np.nan],
+}
+GAS_PR = {
+    EXTRAPOLATE: [0.3363 - 50 * (0.3987 - 0.3363) / 10, 0.3363, 272.3, 272.3 + 60 * (272.3 - 254.7) / 20, np.nan],
+    CLAMP: [0.3363, 0.3363, 272.3, 272.3, np.nan],
+    NAN: [np.nan, 0.3363, 272.3, np.nan, np.nan],
+}
+GAS_STATUS = [BELOW_RANGE, IN_RANGE, IN_RANGE, ABOVE_RANGE, INVALID_INPUT]
+
+SHC_T = np.array([200, 250, 1500, 1600, np.nan])
+SHC_CP = {
+    EXTRAPOLATE: [1.001, 1.003, 1.216, 1.228, np.nan],
+    CLAMP: [1.003, 1.003, 1.216, 1.216, np.nan],
+    NAN: [np.nan, 1.003, 1.216, np.nan, np.nan],
+}
+SHC_CV = {
+    EXTRAPOLATE: [0.714, 0.716, 0.929, 0.941, np.nan],
+    CLAMP: [0.716, 0.716, 0.929, 0.929, np.nan],
+    NAN: [np.nan, 0.716, 0.929, np.nan, np.nan],
+}
+
+
+@pytest.mark.parametrize('policy', [EXTRAPOLATE, CLAMP, NAN])
+def test_lookup_policy_and_status(policy):
+    gas = gas_table(dense=False)
+    out, status = gas.lookup(GAS_T, T, H, policy, status=True)
+    assert_allclose(out, GAS_H[policy], rtol=1e-12, equal_nan=True)
+    assert_array_equal(status, GAS_STATUS)
+    assert status.dtype == np.uint8
+    for val, expected in zip(GAS_T, GAS_H[policy]):
+        assert_allclose(gas.lookup(val, T, H, policy), expected, rtol=1e-12, equal_nan=True)
+
+
+@pytest.mark.parametrize('policy', [CLAMP, NAN])
+def test_pchip_lookup_policy_and_status(policy):
+    out, status = gas_table(dense=False).lookup(GAS_T, T, H, policy, status=True, method=PCHIP)
+    assert_allclose(out, GAS_H[policy], rtol=1e-12, equal_nan=True)
+    assert_array_equal(status, GAS_STATUS)
+
+
+@pytest.mark.parametrize('policy', [EXTRAPOLATE, CLAMP, NAN])
+def test_lookup_many_policy_and_status(policy):
+    (h, pr), status = gas_table(dense=False).lookup_many(GAS_T, T, (H, PR), policy, status=True)
+    assert_allclose(h, GAS_H[policy], rtol=1e-12, equal_nan=True)
+    assert_allclose(pr, GAS_PR[policy], rtol=1e-12, equal_nan=True)
+    assert_array_equal(status, GAS_STATUS)
+
+
+@pytest.mark.parametrize('policy', [EXTRAPOLATE, CLAMP, NAN])
+def test_state_policy(policy):
+    out = gas_table(dense=False).state(GAS_T, T, policy)
+    assert_allclose(out['h'], GAS_H[policy], rtol=1e-12, equal_nan=True)
+    assert_allclose(out['pr'], GAS_PR[policy], rtol=1e-12, equal_nan=True)
+    expected_t = {EXTRAPOLATE: GAS_T, CLAMP: [200, 200, 1240, 1240, np.nan],
+                  NAN: [np.nan, 200, 1240, np.nan, np.nan]}[policy]
+    assert_allclose(out['T'], expected_t, rtol=1e-12, equal_nan=True)
+    assert_allclose(out['u'][1:3], [142.56, 968.95], rtol=1e-12)
+
+
+@pytest.mark.parametrize('policy', [EXTRAPOLATE, CLAMP, NAN])
+def test_spec_heat_policy_and_status(policy):
+    cp, cv, gamma, status = shc_table(dense=False).spec_heat(SHC_T, policy, status=True)
+    assert_allclose(cp, SHC_CP[policy], rtol=1e-12, equal_nan=True)
+    assert_allclose(cv, SHC_CV[policy], rtol=1e-12, equal_nan=True)
+    assert_allclose(gamma, np.divide(SHC_CP[policy], SHC_CV[policy]), rtol=1e-12, equal_nan=True)
+    assert_array_equal(status, GAS_STATUS)
+
+
+def test_unknown_policy_raises():
+    gas = gas_table(dense=False)
+    for call in (lambda: gas.lookup(300, T, H, 'wrap'), lambda: gas.lookup_many(300, T, (H,), 'wrap'),
+                 lambda: gas.state(300, T, 'wrap'), lambda: gas.lookup_deriv(300, T, H, LINEAR, 'wrap'),
+                 lambda: shc_table().spec_heat(300, 'wrap')):
+        with pytest.raises(ValueError):
+            call()
+
+
+# Compiled block cache, against a copy of the gas table csv in a temporary
+# cache_dir
+@pytest.fixture
+def csv_copy(tmp_path):
+    path = tmp_path / 'gas.csv'
+    shutil.copy(GAS_TABLE_CSV, path)
+    return str(path)
+
+
+def cache_files(cache_dir):
+    return sorted(entry for entry in os.listdir(cache_dir) if entry.endswith('.bin'))
+
+
+def test_cache_hit_maps_the_written_block(csv_copy, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    first = load_table(csv_copy, GAS_PAIRS, cache_dir=cache_dir, names=GAS_COLUMNS)
+    files = cache_files(cache_dir)
+    assert len(files) == 1
+    mtime = os.stat(os.path.join(cache_dir, files[0])).st_mtime_ns
+
+    second = load_table(csv_copy, GAS_PAIRS, cache_dir=cache_dir, names=GAS_COLUMNS)
+    assert cache_files(cache_dir) == files
+    assert os.stat(os.path.join(cache_dir, files[0])).st_mtime_ns == mtime
+    assert not second.array.flags.writeable
+    assert_array_equal(second.array, first.array)
+    parsed = load_table(csv_copy, GAS_PAIRS, cache_dir=None, names=GAS_COLUMNS)
+    assert_array_equal(second.lookup(GAS_T, T, H), parsed.lookup(GAS_T, T, H))
+
+
+def test_csv_edit_invalidates_cache(csv_copy, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    old = load_table(csv_copy, GAS_PAIRS, cache_dir=cache_dir, names=GAS_COLUMNS)
+    old_files = cache_files(cache_dir)
+
+    with open(csv_copy) as csv:
+        lines = csv.read().splitlines()
+    row = lines[0].split()
+    row[1] = '199.5'
+    lines[0] = ' '.join(row)
+    with open(csv_copy, 'w') as csv:
+        csv.write('\n'.join(lines) + '\n')
+
+    new = load_table(csv_copy, GAS_PAIRS, cache_dir=cache_dir, names=GAS_COLUMNS)
+    assert new.lookup(200.0, T, H) == 199.5
+    assert old.lookup(200.0, T, H) == 199.97
+    files = cache_files(cache_dir)
+    assert len(files) == 1 and files != old_files
+
+
+@pytest.mark.parametrize('contents', [b'', b'PJPTABLE', b'not a table file at all, just text' * 4, None])
+def test_truncated_or_foreign_cache_file_is_rebuilt(csv_copy, tmp_path, contents):
+    cache_dir = str(tmp_path / 'cache')
+    load_table(csv_copy, GAS_PAIRS, cache_dir=cache_dir, names=GAS_COLUMNS)
+    cache_path = os.path.join(cache_dir, cache_files(cache_dir)[0])
+    if contents is None:
+        # Valid header, block cut short
+        with open(cache_path, 'rb') as cache:
+            contents = cache.read()[:-8]
+    with open(cache_path, 'wb') as cache:
+        cache.write(contents)
+
+    with pytest.raises(ValueError):
+        map_block(cache_path)
+    table = load_table(csv_copy, GAS_PAIRS, cache_dir=cache_dir, names=GAS_COLUMNS)
+    assert_allclose(table.lookup(GAS_T, T, H), GAS_H[EXTRAPOLATE], rtol=1e-12, equal_nan=True)
+    map_block(cache_path)
+
+
+def test_unwritable_cache_dir_parses_csv(csv_copy, tmp_path):
+    # A cache dir below a regular file can never be created, whatever the
+    # permissions of the user running the tests
+    blocker = tmp_path / 'blocker'
+    blocker.write_bytes(b'')
+    table = load_table(csv_copy, GAS_PAIRS, cache_dir=str(blocker / 'cache'), names=GAS_COLUMNS)
+    assert not table.array.flags.writeable
+    assert_allclose(table.lookup(GAS_T, T, H), GAS_H[EXTRAPOLATE], rtol=1e-12, equal_nan=True)
+    assert not any(entry.endswith('.tmp') for entry in os.listdir(tmp_path))
+
+
+def test_remove_stale_keeps_other_pairs_and_tables(csv_copy, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    load_table(csv_copy, GAS_PAIRS, cache_dir=cache_dir, names=GAS_COLUMNS)
+    load_table(csv_copy, ((T, H), (H, T)), cache_dir=cache_dir, names=GAS_COLUMNS)
+    shutil.copy(csv_copy, tmp_path / 'other.csv')
+    load_table(str(tmp_path / 'other.csv'), GAS_PAIRS, cache_dir=cache_dir, names=GAS_COLUMNS)
+    files = cache_files(cache_dir)
+    assert len(files) == 3
+
+    # Both pair sets load from their own files, neither removes the other
+    for pairs in (GAS_PAIRS, ((T, H), (H, T))):
+        load_table(csv_copy, pairs, cache_dir=cache_dir, names=GAS_COLUMNS)
+    assert cache_files(cache_dir) == files
+
+    keep = [name for name in files if name.startswith('gas-')][0]
+    prefix = keep[:keep.rindex('-v') + 2]
+    stale = os.path.join(cache_dir, prefix + '1-0123456789abcdef.bin')
+    open(stale, 'wb').close()
+    open(os.path.join(cache_dir, prefix + 'notes.txt'), 'wb').close()
+    remove_stale(cache_dir, prefix, os.path.join(cache_dir, keep))
+    assert not os.path.exists(stale)
+    assert cache_files(cache_dir) == files
+    assert os.path.exists(os.path.join(cache_dir, prefix + 'notes.txt'))
+
+
+# Dense grids: the pr pairs cannot reach the default target within the
+# budget and say so, every linear lookup of a dense table uses the grids
+def test_resampled_warns_when_target_missed():
+    with pytest.warns(RuntimeWarning, match='pr -> T'):
+        dense = gas_table(dense=False).resampled()
+    assert max(dense.dense_error.values()) > prop_tables.DENSE_TARGET_ERROR
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        dense = shc_table(dense=False).resampled()
+    assert max(dense.dense_error.values()) <= prop_tables.DENSE_TARGET_ERROR
+
+
+def test_dense_state_and_deriv_match_lookup():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        dense = gas_table(dense=False).resampled()
+    val = np.linspace(150, 1300, 1001)
+    h, pr = dense.lookup_many(val, T, (H, PR))
+    table_h = gas_table(dense=False).lookup(val, T, H)
+    assert np.any(h != table_h)
+    for policy in (EXTRAPOLATE, CLAMP, NAN):
+        state = dense.state(val, T, policy)
+        assert_array_equal(state['h'], dense.lookup(val, T, H, policy))
+        assert_array_equal(state['pr'], dense.lookup(val, T, PR, policy))
+        out, dout = dense.lookup_deriv(val, T, H, LINEAR, policy)
+        assert_allclose(out, dense.lookup(val, T, H, policy), rtol=1e-14, equal_nan=True)
+    knots, slope, intercept = dense.linear_segments(T, H)
+    assert len(knots) == len(slope) + 1 == dense.dense[T][2] + 1
@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose, assert_array_equal
+
+from NewSim import PCM1, PCM2, PCM3, PCM4, prop_tables
+from NewSim.product_tables import air_product_table
+from NewSim.prop_tables import IN_RANGE, BELOW_RANGE, ABOVE_RANGE, INVALID_INPUT
+from NewSim.stage_graph import (Engine, Compressor, Combustor, Turbine, Nozzle, pcm2_engine,
+                                shared_engine, CONSTANT_CP, ENTHALPY)
+from NewSim.station_record import StationRecord, FIELDS
+
+# Reference values of the hand-written station chains the models had before
+# they became stage_graph configurations
+RTOL = 1e-12
+
+
+def test_pcm1_calc():
+    assert_allclose(PCM1.calc(), 110.61223634519433, rtol=RTOL)
+
+
+@pytest.mark.parametrize('effs, variable_cp, expected', [
+    ((0.675, 0.925, 0.725, 1), False,
+     (630.9778772559335, 148.492125210841, 1208.2123538387727, 188.03923641605664)),
+    ((0.675, 0.925, 0.725, 1), True,
+     (594.7206307886931, 139.95947172760327, 1123.7459333045379, 182.67386601240125)),
+    ((0.65, 0.9, 0.7, 0.98), False,
+     (607.4282601698495, 142.9500407494618, 1160.8965435442726, 183.70953311617538)),
+    ((0.65, 0.9, 0.7, 0.98), True,
+     (571.7563001442588, 134.55512652889936, 1080.6302261518538, 178.27013394429113)),
+])
+def test_pcm2_shc_eff(effs, variable_cp, expected):
+    assert_allclose(PCM2.shc_eff(*effs, variable_cp=variable_cp), expected, rtol=RTOL)
+
+
+@pytest.mark.parametrize('flow_fuel, variable_cp, expected, t4, p5', [
+    (390, False, (35.67319493314829, 630.9778772559335, 565.6515314751856, 148.492125210841),
+     1335.070271991186, 188.03923641605664),
+    (390, True, (35.66211775634933, 594.7206307886931, 536.0830856537135, 139.95947172760327),
+     1253.174481210738, 182.67386601240125),
+    (250, False, (35.67319493314829, 477.50967390795864, 439.09503373151875, 111.46070600832397),
+     1021.1322047227949, 162.9544466694883),
+    (250, True, (35.66211775634933, 454.0301306829322, 419.4392864847326, 105.98009146245228),
+     981.0896085361961, 158.92775612741278),
+])
+def test_pcm3_fuel_level(flow_fuel, variable_cp, expected, t4, p5):
+    result = PCM3.fuel_level_stations(flow_fuel, variable_cp)
+    assert_allclose(result[:4], expected, rtol=RTOL)
+    assert_allclose(result.temperatures[[0, 4]], [293.15, t4], rtol=RTOL)
+    assert_allclose(result.temperatures[5:9], result.temperatures[5], rtol=RTOL)
+    assert_allclose(result.pressures[[0, 3, 5, 8]], [101.3, 293.77, p5, p5], rtol=RTOL)
+
+
+def test_pcm3_batch_matches_scalar():
+    batch = PCM3.fuel_level_stations(np.array([250.0, 390.0]))
+    assert batch.temperatures.shape == (10, 2)
+    assert_allclose(batch.thrust, [PCM3.fuel_level(250)[3], PCM3.fuel_level(390)[3]], rtol=RTOL)
+
+
+@pytest.mark.parametrize('inputs, expected', [
+    ((339.98, 0, 1), (100.00091937426949, 1157.934482864383, 975.5746433990486)),
+    ((349.38, 0.5, 0.5), (100.00035222096066, 1179.6116915475052, 992.8076483055381)),
+])
+def test_pcm4_fuel_level_chain(inputs, expected):
+    assert_allclose(PCM4.fuelLevelChain(*inputs), expected, rtol=RTOL)
+
+
+def test_pcm4_record():
+    record = StationRecord(())
+    PCM4.fuelLevelChain(349.38, 0.5, 0.5, record=record)
+    expected = {'t3': 451.3714738925268, 'h3': 453.20164631816243, 't4': 1179.6116915475052,
+                'h4': 1253.8852908021286, 'p5': 141.16227847090474, 't9': 913.2728821325841,
+                'h9': 947.1357410968003, 'w_shaft': 1.0, 'w_comp': 35.77362965317736,
+                'w_turb': 50.722247797486, 'q_fuel': 190.151666325}
+    for name, val in expected.items():
+        assert_allclose(record[name], val, rtol=RTOL, err_msg=name)
+
+
+def test_pcm4_air_products_match_air_tables():
+    flow = np.linspace(200, 390, 7)
+    assert_allclose(PCM4.fuelLevelChain(flow, 0.5, 0.5, products=air_product_table()),
+                    PCM4.fuelLevelChain(flow, 0.5, 0.5), rtol=1e-10)
+
+
+def test_pcm4_float32_stays_float32():
+    out = PCM4.fuelLevelChain(np.full(3, 339.98, dtype=np.float32), np.float32(0), np.float32(1))
+    assert all(val.dtype == np.float32 for val in out)
+    assert_allclose(out[0], 100.00091937426949, rtol=1e-5)
+
+
+# The compiled kernel is pcm4_engine lowered by hand, every station field
+# has to match the engine
+@pytest.mark.parametrize('parallel', [True, False])
+def test_pcm4_kernel_matches_engine(parallel):
+    if not PCM4.kernels().HAVE_NUMBA:
+        pytest.skip("numba not installed")
+    rng = np.random.default_rng(0)
+    flow = 200 + 190 * rng.random(64)
+    w_elec = rng.random(64)
+    eff_gen = 0.5 + 0.5 * rng.random(64)
+    kernel = PCM4.fuelLevelBatch(flow, w_elec, eff_gen, backend='numba', parallel=parallel, stations=True)
+    engine = PCM4.fuelLevelBatch(flow, w_elec, eff_gen, backend='numpy', stations=True)
+    for name in FIELDS:
+        assert_allclose(kernel[name], engine[name], rtol=1e-12, err_msg=name)
+
+
+# With dense tables the kernel reads the dense grids too
+@pytest.mark.filterwarnings('ignore:dense grids')
+def test_pcm4_kernel_matches_engine_on_dense_tables():
+    if not PCM4.kernels().HAVE_NUMBA:
+        pytest.skip("numba not installed")
+    flow = np.linspace(200, 390, 64)
+    prop_tables.use_dense_tables()
+    try:
+        kernel = PCM4.fuelLevelBatch(flow, 0.5, 0.75, backend='numba', stations=True)
+        engine = PCM4.fuelLevelBatch(flow, 0.5, 0.75, backend='numpy', stations=True)
+    finally:
+        prop_tables.use_dense_tables(False)
+    for name in FIELDS:
+        assert_allclose(kernel[name], engine[name], rtol=1e-12, err_msg=name)
+
+
+def test_engine_batches_broadcast():
+    engine = pcm2_engine()
+    eff = np.array([0.6, 0.675, 0.75])
+    batch = engine.run('thrust', eff_comp=eff[:, None], eff_turb=eff[None, :])
+    assert batch.shape == (3, 3)
+    assert_allclose(batch[1, 1], engine.run('thrust', eff_comp=0.675, eff_turb=0.675), rtol=RTOL)
+    threads = engine.run('thrust', workers=2, eff_comp=eff[:, None], eff_turb=eff[None, :])
+    assert_allclose(threads, batch, rtol=RTOL)
+
+
+def test_engine_rejects_bad_chains():
+    with pytest.raises(ValueError):
+        Engine([Compressor(CONSTANT_CP), Turbine(CONSTANT_CP), Combustor(CONSTANT_CP),
+                Nozzle(CONSTANT_CP)]).compile()
+    with pytest.raises(ValueError):
+        pcm2_engine().run('thrust', eff_fan=0.9)
+    with pytest.raises(ValueError):
+        pcm2_engine().run('thrust', products=air_product_table())
+    with pytest.raises(ValueError):
+        Engine([Compressor(ENTHALPY)]).run('thrust')
+
+
+# Range status bits of each sample: ambient below the tables, a normal
+# point, a combustor exit above them and a nan input
+def test_run_status_marks_extrapolated_samples():
+    engine = shared_engine('PCM1')
+    t0 = np.array([150.0, 300.0, 300.0, np.nan])
+    flow_fuel = np.array([80.0, 80.0, 1500.0, 80.0])
+    expected = [BELOW_RANGE, IN_RANGE, ABOVE_RANGE, INVALID_INPUT]
+    with np.errstate(invalid='ignore'):
+        thrust, status = engine.run('thrust', status=True, t0=t0, flow_fuel=flow_fuel)
+        threads = engine.run('thrust', status=True, workers=2, t0=t0, flow_fuel=flow_fuel)
+    assert status.dtype == np.uint8
+    assert_array_equal(status, expected)
+    assert_allclose(thrust, engine.run('thrust', t0=t0, flow_fuel=flow_fuel), rtol=RTOL, equal_nan=True)
+    assert_array_equal(threads[1], status)
+    assert engine.run('thrust', status=True)[1] == IN_RANGE
+
+
+def test_pcm1_monte_carlo_reports_out_of_envelope_runs():
+    data, mean, sd, status = PCM1.monte_carlo(2000, uncertain=dict(PCM1.UNCERTAIN_INPUTS, t0=(200, 40)))
+    out = status != IN_RANGE
+    assert status.shape == (2000,)
+    assert 0 < np.count_nonzero(out) < 2000
+    assert np.all(status[out] & BELOW_RANGE)
+    assert not np.any(status & INVALID_INPUT)
+    assert_array_equal(PCM1.monte_carlo(2000)[3], IN_RANGE)